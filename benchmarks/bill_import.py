@@ -0,0 +1,64 @@
+import time
+import psycopg2
+from db import connection
+from bill_import import import_bills
+from benchmarks.datagen import generate
+
+BILL_COUNTS = [10, 100, 1000]
+ITEMS_PER_BILL = 20
+TARGET_ITEMS_PER_SEC = 10000
+
+
+# Function to build create-bill payloads with names that do not clash with stored bills
+def payloads(bills):
+    _, _, bills_j = generate(1, bills, ITEMS_PER_BILL, 1)
+    return [{"bill": f"Import {time.time_ns()} {bill['name']}", "billGroup": bill["group"], "items": bill["items"]}
+            for bill in bills_j]
+
+
+# Previous path: what create_bill runs for each bill, sent as one request per bill
+def per_bill_insert(cur, bills):
+    for bill in bills:
+        entries = ", ".join(cur.mogrify("(%s, %s, %s, %s, %s)", (bill["bill"], item["name"], item["cost"],
+                                                                 item["quantity"], item["type"])).decode()
+                            for item in bill["items"])
+        cur.execute(f"insert into items (bill_name, item_name, cost, quantity, type) values {entries};")
+        cur.execute("insert into bills (bill_name, bill_group, status) values (%s, %s, 'open');",
+                    (bill["bill"], bill["billGroup"]))
+
+
+# Current path: validation then batched inserts for the whole payload
+def bulk_import(cur, bills):
+    results = import_bills(cur, bills)
+    assert all(result["success"] for result in results), results
+
+
+def timed(cur, fn, bills):
+    cur.execute("savepoint bench;")
+    start = time.perf_counter()
+    fn(cur, bills)
+    elapsed = time.perf_counter() - start
+    cur.execute("rollback to savepoint bench;")
+    return elapsed
+
+
+def main():
+    conn = psycopg2.connect(connection)
+    cur = conn.cursor()
+    print(f"{'bills':>6} {'items':>7} {'per bill items/s':>17} {'bulk items/s':>13}")
+    best = 0
+    for count in BILL_COUNTS:
+        bills = payloads(count)
+        items = count * ITEMS_PER_BILL
+        per_bill = items / timed(cur, per_bill_insert, bills)
+        bulk = items / timed(cur, bulk_import, bills)
+        best = max(best, bulk)
+        print(f"{count:>6} {items:>7} {per_bill:>17.0f} {bulk:>13.0f}")
+    conn.rollback()
+    conn.close()
+    print(f"Bulk import {'meets' if best >= TARGET_ITEMS_PER_SEC else 'misses'} the "
+          f"{TARGET_ITEMS_PER_SEC} items/sec target")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import time
+import tracemalloc
+from bill_snapshot import build_bill
+
+BILLS = 200
+ITEM_COUNTS = [10, 50, 200]
+USERS_PER_ITEM = 4
+
+
+# Function to generate the rows the snapshot query returns for a bill
+def bill_rows(bill, items):
+    users = [f"user{u}" for u in range(USERS_PER_ITEM * 2)]
+    return [("group0", users, bill * 1000 + i, f"Item {i}", 12.5, 2, "grocery", users[(i + u) % len(users)],
+             3.13, 0.25) for i in range(items) for u in range(USERS_PER_ITEM)]
+
+
+# Previous representation: the nested dicts manage-bill and save-bill rebuilt from three queries
+def build_dicts(name, rows):
+    items = {}
+    shares = {}
+    for _, _, _, item_name, cost, quantity, item_type, username, amount, share in rows:
+        items[item_name] = {"name": item_name, "cost": cost, "quantity": quantity, "type": item_type}
+        shares.setdefault(item_name, []).append({"username": username, "amount": amount, "share": share})
+    return {"name": name, "group": rows[0][0], "users": list(rows[0][1]), "items": list(items.values()),
+            "shares": shares}
+
+
+# Function to measure the memory held by BILLS built bills and the time to build one
+def measure(build, rows):
+    tracemalloc.start()
+    kept = [build(f"Bill {b}", bill_rows) for b, bill_rows in enumerate(rows)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for b, bill_rows in enumerate(rows):
+        build(f"Bill {b}", bill_rows)
+    elapsed = (time.perf_counter() - start) / len(rows) * 1e6
+    del kept
+    return size / len(rows) / 1024, elapsed
+
+
+def main():
+    print(f"{'items':>6} {'dict KB/bill':>13} {'slots KB/bill':>14} {'dict build us':>14} {'slots build us':>15}")
+    for items in ITEM_COUNTS:
+        rows = [bill_rows(b, items) for b in range(BILLS)]
+        dict_size, dict_time = measure(build_dicts, rows)
+        slots_size, slots_time = measure(build_bill, rows)
+        print(f"{items:>6} {dict_size:>13.1f} {slots_size:>14.1f} {dict_time:>14.1f} {slots_time:>15.1f}")
+
+
+if __name__ == '__main__':
+    main()
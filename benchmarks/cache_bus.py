@@ -0,0 +1,83 @@
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import psycopg2
+from db import connection
+from benchmarks.datagen import PASSWORD
+from benchmarks.driver import HttpClient, start_gunicorn
+
+
+# Function to send a request over a new connection, so consecutive requests land on different workers
+def fresh_request(port, method, path, headers, args=None, body=None):
+    return HttpClient(f"127.0.0.1:{port}").request(method, path, headers, args, body)
+
+
+# Function to kill every worker's LISTEN connection so notifications sent meanwhile are missed
+def drop_listeners():
+    conn = psycopg2.connect(connection)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("select pg_terminate_backend(pid) from pg_stat_activity where query ilike 'listen %';")
+    dropped = cur.rowcount
+    conn.close()
+    return dropped
+
+
+# Function to create a user and time until every worker's cached /api/users listing contains it
+def check(port, headers, group, spread, timeout, missed):
+    for _ in range(spread):
+        fresh_request(port, "GET", "/api/users", headers, {"group": group})
+
+    if missed:
+        print(f"Dropped {drop_listeners()} listener connections")
+    first_name = f"bus{uuid.uuid4().hex[:8]}"
+    fresh_request(port, "POST", "/api/create-user", headers, body={
+        "firstName": first_name, "lastName": "Check", "userGroup": group
+    })
+    username = first_name + "C"
+
+    start = time.perf_counter()
+    fresh = 0
+    while fresh < spread:
+        if time.perf_counter() - start > timeout:
+            return None
+        _, payload, _ = fresh_request(port, "GET", "/api/users", headers, {"group": group})
+        fresh = fresh + 1 if username in payload["users"] else 0
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that a write in one gunicorn worker evicts the caches of all")
+    parser.add_argument("--data", default="Database", help="directory written by benchmarks.datagen")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8124)
+    parser.add_argument("--timeout", type=float, default=10)
+    args = parser.parse_args()
+
+    with open(os.path.join(args.data, "users.json")) as file:
+        admin = json.load(file)[0]["username"]
+
+    # Cached responses never expire on their own, and missed notifications are caught by the reconcile every second
+    os.environ.update(RESPONSE_CACHE_TTL="3600", CACHE_BUS_RECONCILE="1", LISTEN_RECONNECT="3600")
+    process, client = start_gunicorn(args.port, ["-w", str(args.workers)])
+    failures = 0
+    try:
+        _, login, _ = client.request("GET", "/api/login", {}, {"username": admin, "password": PASSWORD})
+        headers = {"x-access-token": login["token"], "x-access-user": admin}
+        group = login["userGroup"]
+        for name, missed in [("notification", False), ("reconcile after missed notification", True)]:
+            elapsed = check(args.port, headers, group, 4 * args.workers, args.timeout, missed)
+            failures += elapsed is None
+            print(f"{name}: " + ("stale after timeout" if elapsed is None else f"all workers fresh in "
+                                                                              f"{elapsed * 1000:.0f}ms"))
+    finally:
+        process.terminate()
+        process.wait()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
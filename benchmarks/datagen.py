@@ -0,0 +1,62 @@
+import os
+import json
+import random
+import argparse
+from werkzeug.security import generate_password_hash
+
+PASSWORD = "Bench1$"
+ITEM_TYPES = ["veg", "non-veg", "drink", "grocery", "household"]
+STATUSES = ["open", "open", "open", "settled"]
+
+
+# Function to generate the users, user groups and bills that db_setup.py loads
+def generate(users, bills, items, groups, seed=0):
+    rng = random.Random(seed)
+    password_hash = generate_password_hash(PASSWORD, "sha256")
+    group_names = [f"group{g}" for g in range(groups)]
+
+    users_j = [{
+        "username": f"bench{u}U",
+        "firstName": f"bench{u}",
+        "lastName": "User",
+        "password": password_hash
+    } for u in range(users)]
+    groups_j = [{"name": "admin", "users": [users_j[0]["username"]]}]
+    groups_j += [{"name": name, "users": [user["username"] for user in users_j[1 + g::groups]]}
+                 for g, name in enumerate(group_names)]
+
+    bills_j = [{
+        "name": f"Bench Bill {b}",
+        "group": group_names[b % groups],
+        "status": rng.choice(STATUSES),
+        "items": [{
+            "name": f"Item {i}",
+            "cost": round(rng.uniform(0.5, 80), 2),
+            "quantity": rng.randint(1, 6),
+            "type": rng.choice(ITEM_TYPES)
+        } for i in range(items)]
+    } for b in range(bills)]
+    return users_j, groups_j, bills_j
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate Database/*.json inputs for db_setup.py")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--bills", type=int, default=200)
+    parser.add_argument("--items", type=int, default=15, help="items per bill")
+    parser.add_argument("--groups", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="Database")
+    args = parser.parse_args()
+
+    users_j, groups_j, bills_j = generate(args.users, args.bills, args.items, args.groups, args.seed)
+    os.makedirs(args.out, exist_ok=True)
+    for name, data in [("users", users_j), ("userGroups", groups_j), ("bills", bills_j)]:
+        with open(os.path.join(args.out, f"{name}.json"), "w") as file:
+            json.dump(data, file)
+    print(f"Wrote {len(users_j)} users, {len(bills_j)} bills and {len(bills_j) * args.items} items to {args.out}/ "
+          f"(password for every user: {PASSWORD})")
+
+
+if __name__ == '__main__':
+    main()
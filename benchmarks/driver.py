@@ -0,0 +1,285 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlencode
+from benchmarks.datagen import PASSWORD
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Drives the app in-process through the Flask test client
+class FlaskClient:
+    def __init__(self):
+        os.environ.setdefault("NOTIFY_TRANSPORT", "fake")
+        from server import app
+
+        app.config["QUERY_COUNT_HEADER"] = True
+        self.client = app.test_client()
+
+    def request(self, method, path, headers, args=None, body=None):
+        response = self.client.open(path, method=method, query_string=args, json=body, headers=headers)
+        return response.status_code, response.get_json(silent=True), response.headers.get("X-Query-Count")
+
+
+# Drives a running server over HTTP, one connection per thread
+class HttpClient:
+    def __init__(self, url):
+        self.host, _, port = url.split("://")[-1].rstrip("/").partition(":")
+        self.port = int(port or 80)
+        self._local = threading.local()
+
+    def request(self, method, path, headers, args=None, body=None):
+        if not hasattr(self._local, "conn"):
+            self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        conn = self._local.conn
+        headers = dict(headers, **{"Content-Type": "application/json"})
+        url = path + ("?" + urlencode(args) if args else "")
+        try:
+            conn.request(method, url, body=None if body is None else json.dumps(body), headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            raise
+        try:
+            payload = json.loads(data) if data else None
+        except ValueError:
+            payload = None
+        return response.status, payload, response.getheader("X-Query-Count")
+
+
+# Function to start gunicorn on a local port and wait for it to answer pings
+def start_gunicorn(port, extra_args=()):
+    env = dict(os.environ, QUERY_COUNT_HEADER="1", NOTIFY_TRANSPORT="fake")
+    process = subprocess.Popen(["gunicorn", "server:app", "-c", "gunicorn.conf.py", "-b", f"127.0.0.1:{port}",
+                                *extra_args], env=env)
+    client = HttpClient(f"127.0.0.1:{port}")
+    for _ in range(100):
+        try:
+            if client.request("GET", "/api/ping", {})[0] == 200:
+                return process, client
+        except OSError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    sys.exit("gunicorn did not start")
+
+
+# Records latency and query counts per route
+class Recorder:
+    def __init__(self):
+        self.routes = {}
+        self._lock = threading.Lock()
+
+    def add(self, route, elapsed, status, queries):
+        with self._lock:
+            entry = self.routes.setdefault(route, {"latencies": [], "queries": [], "errors": 0})
+            entry["latencies"].append(elapsed)
+            if queries is not None:
+                entry["queries"].append(int(queries))
+            if status >= 400:
+                entry["errors"] += 1
+
+    def report(self, wall_time):
+        routes = {}
+        for route, entry in sorted(self.routes.items()):
+            latencies = sorted(entry["latencies"])
+            routes[route] = {
+                "requests": len(latencies),
+                "errors": entry["errors"],
+                "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+                "queries_per_request": round(sum(entry["queries"]) / len(entry["queries"]), 2)
+                if entry["queries"] else None
+            }
+        total = sum(route["requests"] for route in routes.values())
+        return {
+            "total": {
+                "requests": total,
+                "errors": sum(route["errors"] for route in routes.values()),
+                "seconds": round(wall_time, 3),
+                "throughput_rps": round(total / wall_time, 2) if wall_time else None
+            },
+            "routes": routes
+        }
+
+
+def percentile(values, pct):
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+# Exercises every /api route around one bill and one user
+class Session:
+    def __init__(self, client, recorder, users, bills, seed):
+        self.client = client
+        self.recorder = recorder
+        self.users = users
+        self.bills = bills
+        self.rng = random.Random(seed)
+        self.admin = users[0]["username"]
+        self.headers = {}
+
+    def call(self, route, method, args=None, body=None):
+        start = time.perf_counter()
+        status, payload, queries = self.client.request(method, route, self.headers, args, body)
+        self.recorder.add(route, time.perf_counter() - start, status, queries)
+        return payload
+
+    def login(self):
+        payload = self.call("/api/login", "GET", {"username": self.admin, "password": PASSWORD})
+        if not payload or not payload.get("success"):
+            sys.exit("Login failed, load the generated dataset with db_setup.py first")
+        self.headers = {"x-access-token": payload["token"], "x-access-user": self.admin}
+        return payload["userGroup"]
+
+    def iteration(self, user_index):
+        bill = self.rng.choice(self.bills)
+        username = self.users[user_index]["username"]
+        items = [{"name": item["name"], "cost": item["cost"], "share": 0} for item in bill["items"]]
+
+        self.call("/api/ping", "GET")
+        self.call("/api/user", "GET", {"username": username})
+        self.call("/api/bills", "GET", {"userGroup": bill["group"]})
+        self.call("/api/bill", "GET", {"bill": bill["name"]})
+        self.call("/api/users", "GET", {"group": bill["group"]})
+        self.call("/api/add-user-bills", "POST", body={"username": username, "bills": [bill["name"]]})
+        self.call("/api/update-user-bill", "POST", body={"username": username, "bill": bill["name"], "items": items})
+        self.call("/api/user-bills", "GET", {"username": username})
+        self.call("/api/user-bill", "GET", {"username": username, "bill": bill["name"]})
+        self.call("/api/lock-user-bill", "POST", body={"username": username, "bill": bill["name"]})
+        managed = self.call("/api/manage-bill", "GET", {"bill": bill["name"]}) or {"items": []}
+        self.call("/api/save-bill", "POST", body={
+            "bill": bill["name"], "newUsers": [], "oldUsers": [], "items": managed["items"]
+        })
+        self.call("/api/unlock-bill", "POST", body={"users": [username], "bill": bill["name"]})
+        self.call("/api/bill-split", "GET", {"bill": bill["name"]})
+        self.call("/api/all-bills", "GET")
+        self.call("/api/all-users", "GET")
+        self.call("/api/remove-user-bills", "POST", body={"username": username, "bills": [bill["name"]]})
+
+    def writes(self):
+        name = f"Driver Bill {uuid.uuid4().hex[:10]}"
+        self.call("/api/create-bill", "POST", body={
+            "bill": name, "billGroup": self.bills[0]["group"], "members": [self.admin],
+            "items": [{"name": "Driver Item", "cost": 10, "quantity": 1, "type": "grocery"}]
+        })
+        self.call("/api/submit-bill", "POST", body={"bill": name})
+        self.call("/api/create-user", "POST", body={
+            "firstName": f"drv{uuid.uuid4().hex[:10]}", "lastName": "Bench", "userGroup": self.bills[0]["group"]
+        })
+        self.call("/api/password", "POST", body={"username": self.admin, "password": PASSWORD})
+
+
+# Function to print per route changes against an earlier JSON report
+def compare(report, baseline_path):
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    print(f"\n{'route':<24} {'p50 before':>11} {'p50 now':>9} {'p95 before':>11} {'p95 now':>9}")
+    for route, entry in report["routes"].items():
+        before = baseline["routes"].get(route)
+        if before is not None:
+            print(f"{route:<24} {before['p50_ms']:>11.2f} {entry['p50_ms']:>9.2f} "
+                  f"{before['p95_ms']:>11.2f} {entry['p95_ms']:>9.2f}")
+
+
+# Function to run the workload from concurrent sessions and report it
+def run_workload(client, users, bills, iterations, concurrency, seed):
+    recorder = Recorder()
+
+    # Every thread works on its own users so concurrent add/remove calls never collide
+    def run(thread):
+        session = Session(client, recorder, users, bills, seed + thread)
+        session.login()
+        thread_users = range(1 + thread, len(users), concurrency)
+        for i in range(iterations):
+            session.iteration(thread_users[i % len(thread_users)])
+        session.writes()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(run, range(concurrency)))
+    return recorder.report(time.perf_counter() - start)
+
+
+# Function to run the workload against gunicorn once per worker mode and print their throughput side by side
+def compare_modes(modes, port, users, bills, iterations, concurrency, seed):
+    print(f"{'mode':<8} {'requests/s':>11} {'errors':>7} {'slowest route p95 ms':>21}")
+    for mode in modes:
+        os.environ["GUNICORN_WORKER_MODE"] = mode
+        process, client = start_gunicorn(port)
+        try:
+            report = run_workload(client, users, bills, iterations, concurrency, seed)
+        finally:
+            process.terminate()
+            process.wait()
+        slowest = max(entry["p95_ms"] for entry in report["routes"].values())
+        print(f"{mode:<8} {report['total']['throughput_rps']:>11.1f} {report['total']['errors']:>7} {slowest:>21.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive every /api route and report latency percentiles")
+    parser.add_argument("--data", default="Database", help="directory written by benchmarks.datagen")
+    parser.add_argument("--url", help="server to drive over HTTP instead of the Flask test client")
+    parser.add_argument("--gunicorn", action="store_true", help="start gunicorn locally and drive it over HTTP")
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="JSON report of an earlier run to compare against")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--worker-modes", help="comma separated gunicorn worker modes to compare, e.g. "
+                                               "sync,gthread,gevent")
+    args = parser.parse_args()
+
+    with open(os.path.join(args.data, "users.json")) as file:
+        users = json.load(file)
+    with open(os.path.join(args.data, "bills.json")) as file:
+        bills = [bill for bill in json.load(file) if bill["status"] != "settled"]
+
+    if args.worker_modes:
+        compare_modes(args.worker_modes.split(","), args.port, users, bills, args.iterations, args.concurrency,
+                      args.seed)
+        return
+
+    process = None
+    if args.gunicorn:
+        process, client = start_gunicorn(args.port)
+    elif args.url:
+        client = HttpClient(args.url)
+    else:
+        client = FlaskClient()
+
+    concurrency = args.concurrency if args.url or args.gunicorn else 1
+    try:
+        report = run_workload(client, users, bills, args.iterations, concurrency, args.seed)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    report["meta"] = {
+        "mode": "gunicorn" if args.gunicorn else "http" if args.url else "flask",
+        "iterations": args.iterations,
+        "concurrency": concurrency,
+        "users": len(users),
+        "bills": len(bills)
+    }
+
+    print(json.dumps(report, indent=2, sort_keys=True))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
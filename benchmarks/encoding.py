@@ -0,0 +1,58 @@
+import time
+import encoding
+from decimal import Decimal
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+USER_COUNTS = [1000, 10000, 50000]
+BILLS_PER_USER = 5
+RUNS = 3
+
+
+# Function to build an /api/all-users payload with amounts in the given representation
+def all_users(users, number):
+    return {
+        "users": [{
+            "username": f"user{u:06d}",
+            "outstanding": number(f"{12.5 * BILLS_PER_USER + u % 100:.2f}"),
+            "bills": [{"name": f"Bill {b}", "amount": number(f"{12.5 + b:.2f}"), "paid": False}
+                      for b in range(BILLS_PER_USER)]
+        } for u in range(users)],
+        "next": None
+    }
+
+
+# Function to get the best time of a few runs in milliseconds
+def best_ms(fn, *args):
+    times = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def main():
+    app = Flask(__name__)
+    flask_json = DefaultJSONProvider(app)
+    fast_json = encoding.FastJSONProvider(app)
+
+    print(f"{'users':>6} {'MB':>6} {'flask float ms':>15} {'fast float ms':>14} {'fast cents ms':>14}")
+    with app.app_context():
+        for users in USER_COUNTS:
+            floats = all_users(users, float)
+            cents = all_users(users, Decimal)
+            size = len(fast_json.dumps(floats)) / 1e6
+            print(f"{users:>6} {size:>6.1f} {best_ms(flask_json.dumps, floats):>15.1f} "
+                  f"{best_ms(fast_json.dumps, floats):>14.1f} {best_ms(fast_json.dumps, cents):>14.1f}")
+
+    # Decoding cost of the numeric typecaster per value in each representation
+    values = [f"{value / 100:.2f}" for value in range(200000)]
+    for mode in ("float", "cents"):
+        encoding.NUMERIC_MODE = mode
+        elapsed = best_ms(lambda: [encoding.decode_numeric(value, None) for value in values])
+        print(f"decode {mode:<6} {elapsed / len(values) * 1e6:.0f} ns/value")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import time
+import server
+import psycopg2
+from cache import TTLCache
+from db import connection
+from werkzeug.security import generate_password_hash, check_password_hash
+
+SIZES = [100, 10_000, 100_000]
+ROUNDS = 200
+PASSWORD = "abC1$d"
+
+
+# Function to seed a temporary users table with n rows sharing one password hash
+def seed_users(cur, n, password_hash):
+    cur.execute("create temp table users (username text primary key, first_name text not null,"
+                " last_name text not null, password text not null, user_group text not null);")
+    cur.execute("insert into users select 'user' || i, 'First', 'Last', %s, 'group' || (i % 20)"
+                " from generate_series(1, %s) i;", (password_hash, n))
+    cur.execute("analyze users;")
+
+
+# Previous login path: fetch every hash, check, then a second query for the profile
+def full_scan_login(cur, username, password):
+    cur.execute("select username, password from users;")
+    users_dict = {name: value for name, value in cur.fetchall()}
+    if username not in users_dict or not check_password_hash(users_dict[username], password):
+        return False
+    cur.execute("select first_name, last_name, user_group from users where username=%s;", (username,))
+    return cur.fetchone() is not None
+
+
+# Current login path: the route's primary key lookup and password check, through the worker's login cache
+def indexed_login(cur, username, password):
+    cur.execute(server.LOGIN_QUERY, {"username": username})
+    user = cur.fetchone()
+    return user is not None and server.verify_password(username, user[0], password)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        assert fn(*args)
+    return (time.perf_counter() - start) / ROUNDS * 1000
+
+
+def main():
+    password_hash = generate_password_hash(PASSWORD, "sha256")
+    print(f"{'users':>8} {'full scan ms':>14} {'indexed ms':>12} {'cached ms':>11}")
+    for size in SIZES:
+        conn = psycopg2.connect(connection)
+        cur = conn.cursor()
+        seed_users(cur, size, password_hash)
+        username = f"user{size // 2}"
+        full_scan = timed(full_scan_login, cur, username, PASSWORD)
+        server.login_cache = TTLCache(0, 0)
+        indexed = timed(indexed_login, cur, username, PASSWORD)
+        server.login_cache = TTLCache(1024, 300)
+        cached = timed(indexed_login, cur, username, PASSWORD)
+        print(f"{size:>8} {full_scan:>14.3f} {indexed:>12.3f} {cached:>11.3f}")
+        conn.rollback()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
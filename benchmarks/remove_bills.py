@@ -0,0 +1,69 @@
+import time
+import psycopg2
+from db import connection
+
+BILL_COUNTS = [1, 10, 50, 200, 1000]
+ITEMS_PER_BILL = 20
+SCHEMA = "bench_remove_bills"
+
+
+# Function to create a scratch schema with one user holding items on every bill
+def seed(cur, bills):
+    cur.execute(f"drop schema if exists {SCHEMA} cascade; create schema {SCHEMA}; set search_path to {SCHEMA};")
+    cur.execute("create table items (item_id serial primary key, bill_name text not null, item_name text not null);")
+    cur.execute("create table user_bills (username text, bill_name text, primary key (username, bill_name));")
+    cur.execute("create table user_items (username text, item_id int, primary key (username, item_id));")
+    cur.execute("insert into items (bill_name, item_name) select 'bill' || b, 'item' || i\n"
+                "from generate_series(1, %s) b, generate_series(1, %s) i;", (bills, ITEMS_PER_BILL))
+    cur.execute("insert into user_bills select 'user', 'bill' || b from generate_series(1, %s) b;", (bills,))
+    cur.execute("insert into user_items select 'user', item_id from items;")
+    cur.execute("create index on items (bill_name); analyze;")
+
+
+# Previous path: one new connection and query per bill to collect its item ids
+def per_bill_removal(cur, bills):
+    ids = []
+    for bill in bills:
+        conn = psycopg2.connect(connection, options=f"-c search_path={SCHEMA}")
+        bill_cur = conn.cursor()
+        bill_cur.execute("select item_id from items where bill_name=%s;", (bill,))
+        ids.extend(row[0] for row in bill_cur.fetchall())
+        conn.close()
+    cur.execute("delete from user_bills where username='user' and bill_name = any(%s);", (bills,))
+    cur.execute("delete from user_items where username='user' and item_id = any(%s);", (ids,))
+
+
+# Current path: two set-based deletes joining user_items to items
+def set_based_removal(cur, bills):
+    cur.execute("delete from user_bills where username='user' and bill_name = any(%s);", (bills,))
+    cur.execute("delete from user_items ui using items i\n"
+                "where ui.item_id=i.item_id and ui.username='user' and i.bill_name = any(%s);", (bills,))
+
+
+def timed(cur, fn, bills):
+    cur.execute("savepoint bench;")
+    start = time.perf_counter()
+    fn(cur, bills)
+    elapsed = (time.perf_counter() - start) * 1000
+    cur.execute("rollback to savepoint bench;")
+    return elapsed
+
+
+def main():
+    conn = psycopg2.connect(connection)
+    cur = conn.cursor()
+    seed(cur, max(BILL_COUNTS))
+    conn.commit()
+
+    print(f"{'bills':>6} {'per bill ms':>12} {'set based ms':>13}")
+    for count in BILL_COUNTS:
+        bills = [f"bill{b}" for b in range(1, count + 1)]
+        print(f"{count:>6} {timed(cur, per_bill_removal, bills):>12.2f} {timed(cur, set_based_removal, bills):>13.2f}")
+
+    cur.execute(f"drop schema {SCHEMA} cascade;")
+    conn.commit()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import time
+import random
+from decimal import Decimal
+from db import fetch_records
+
+SIZES = [10, 1_000, 100_000]
+COLUMNS = ["username", "name", "amount", "paid"]
+
+
+# Function to generate raw rows as psycopg2 receives them, numeric values still in text form
+def raw_rows(n):
+    return [(f"user{i % 50}", f"bill{i % 500}", f"{random.uniform(0, 500):.2f}", False) for i in range(n)]
+
+
+# Previous path: Decimal rows into a DataFrame, cast to float and converted back to records
+def pandas_path(rows):
+    import pandas as pd
+
+    decoded = [(username, name, Decimal(amount), paid) for username, name, amount, paid in rows]
+    df = pd.DataFrame(decoded, columns=COLUMNS)
+    df["amount"] = df["amount"].astype("float")
+    return df.to_dict("records")
+
+
+# Current path: numeric decoded to float by the typecaster, rows zipped straight into records
+def mapper_path(rows):
+    decoded = [(username, name, float(amount), paid) for username, name, amount, paid in rows]
+    return fetch_records(iter(decoded), COLUMNS)
+
+
+def best_of(fn, rows, rounds=5):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    try:
+        import pandas  # noqa: F401
+        has_pandas = True
+    except ImportError:
+        has_pandas = False
+
+    print(f"{'rows':>8} {'pandas ms':>11} {'mapper ms':>11}")
+    for size in SIZES:
+        rows = raw_rows(size)
+        pandas_ms = f"{best_of(pandas_path, rows):>11.3f}" if has_pandas else f"{'n/a':>11}"
+        print(f"{size:>8} {pandas_ms} {best_of(mapper_path, rows):>11.3f}")
+
+
+if __name__ == '__main__':
+    main()
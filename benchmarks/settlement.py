@@ -0,0 +1,44 @@
+import time
+import random
+from settlement import net_balances, settle
+
+USERS = 10000
+ENTRIES = 100000
+PAYERS = 100
+
+
+# Function to generate unpaid (debtor, payer, amount) rows as fetch_debts returns them
+def debts(seed=0):
+    rng = random.Random(seed)
+    users = [f"user{u}" for u in range(USERS)]
+    payers = rng.sample(users, PAYERS)
+    pairs = {}
+    for _ in range(ENTRIES):
+        key = (rng.choice(users), rng.choice(payers))
+        pairs[key] = round(pairs.get(key, 0) + rng.uniform(0.5, 80), 2)
+    return [(debtor, payer, amount) for (debtor, payer), amount in pairs.items()]
+
+
+def main():
+    rows = debts()
+    start = time.perf_counter()
+    balances = net_balances(rows)
+    transfers = settle(balances)
+    elapsed = (time.perf_counter() - start) * 1000
+
+    # Every balance must be cleared by the transfers
+    remaining = dict(balances)
+    for debtor, creditor, cents in transfers:
+        remaining[debtor] += cents
+        remaining[creditor] -= cents
+    assert all(cents == 0 for cents in remaining.values())
+    involved = sum(1 for cents in balances.values() if cents != 0)
+    assert len(transfers) <= involved - 1
+
+    direct = sum(1 for debtor, payer, _ in rows if debtor != payer)
+    print(f"{USERS} users, {ENTRIES} unpaid entries: {direct} direct payments -> {len(transfers)} transfers "
+          f"in {elapsed:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import time
+import random
+from shares import resolve_shares
+
+SIZES = [(1, 2_000, 12), (1, 5_000, 40), (50, 1_000, 24)]
+SHARE_CHOICES = [0, 0, 0, 0.1, 0.2, 0.25, 0.33, 0.5, 0.6, 0.75, 1]
+
+
+# Per-item loop that manage_bill used before the vectorized engine, kept as the reference
+def reference_shares(rows):
+    items_data = {}
+    for item_key, username, share in rows:
+        items_data.setdefault(item_key, []).append({"username": username, "share": float(share)})
+
+    for item_users in items_data.values():
+        sharing = {}
+        specified = {}
+        total_share = 0
+        for user in item_users:
+            if user["share"] == 0:
+                sharing[user["username"]] = None
+            else:
+                specified[user["username"]] = None
+                total_share += user["share"]
+
+        if len(sharing) == 0:
+            if total_share != 1:
+                change = (1 - total_share) / len(specified)
+                for user in item_users:
+                    if user["username"] in specified:
+                        user["share"] = round(user["share"] + change, 2)
+        else:
+            if total_share < 1:
+                change = (1 - total_share) / len(sharing)
+                for user in item_users:
+                    if user["username"] in sharing:
+                        user["share"] = round(change, 2)
+            else:
+                if total_share > 1:
+                    change = (1 - total_share) / len(specified)
+                    for user in item_users:
+                        if user["username"] in specified:
+                            user["share"] += change
+                change = 1 / (len(specified) + len(sharing))
+
+                for user in item_users:
+                    if user["username"] in sharing:
+                        user["share"] = round(change, 2)
+                    else:
+                        user["share"] = round(user["share"] * change * len(specified), 2)
+
+    resolved = {}
+    for item_key, item_users in items_data.items():
+        for user in item_users:
+            resolved[(item_key, user["username"])] = user["share"]
+    return [resolved[(item_key, username)] for item_key, username, _ in rows]
+
+
+# Function to generate share rows for bills with the given number of items and users
+def generate_rows(bills, items, users):
+    rows = []
+    for bill in range(bills):
+        for item in range(items):
+            for user in random.sample(range(users), random.randint(1, users)):
+                rows.append(((bill, item), f"user{user}", random.choice(SHARE_CHOICES)))
+    return rows
+
+
+def main():
+    random.seed(7)
+    # numpy is imported on the engine's first call, keep that out of the timings
+    resolve_shares([], [])
+    print(f"{'bills':>6} {'items':>6} {'users':>6} {'rows':>9} {'loop ms':>9} {'vectorized ms':>14}")
+    for bills, items, users in SIZES:
+        rows = generate_rows(bills, items, users)
+
+        start = time.perf_counter()
+        reference_shares(rows)
+        loop_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        resolve_shares([row[0] for row in rows], [row[2] for row in rows])
+        vector_ms = (time.perf_counter() - start) * 1000
+
+        print(f"{bills:>6} {items:>6} {users:>6} {len(rows):>9} {loop_ms:>9.1f} {vector_ms:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+from benchmarks.driver import start_gunicorn
+
+IMPORT_RUNS = 5
+
+
+# Function to time importing the app in a fresh interpreter, optionally with the lazily imported modules as well
+def import_seconds(extra=""):
+    code = f"import time; start = time.perf_counter(); import server{extra}; print(time.perf_counter() - start)"
+    runs = [float(subprocess.check_output([sys.executable, "-W", "ignore", "-c", code])) for _ in range(IMPORT_RUNS)]
+    return statistics.median(runs)
+
+
+# Function to read resident and proportional set sizes of a process in MB
+def memory_mb(pid):
+    sizes = {}
+    with open(f"/proc/{pid}/smaps_rollup") as file:
+        for line in file:
+            key, _, value = line.partition(":")
+            if key in ("Rss", "Pss"):
+                sizes[key] = int(value.split()[0]) / 1024
+    return sizes["Rss"], sizes["Pss"]
+
+
+# Function to boot gunicorn and measure the time until it answers and the memory of its workers
+def boot(workers, preload, port):
+    os.environ["GUNICORN_PRELOAD"] = "1" if preload else "0"
+    start = time.perf_counter()
+    process, _ = start_gunicorn(port, ["-w", str(workers)])
+    elapsed = time.perf_counter() - start
+    try:
+        # Give the remaining workers time to finish booting after the first one answered
+        time.sleep(2)
+        with open(f"/proc/{process.pid}/task/{process.pid}/children") as file:
+            pids = [int(pid) for pid in file.read().split()]
+        sizes = [memory_mb(pid) for pid in pids]
+    finally:
+        process.terminate()
+        process.wait()
+    return elapsed, sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app import time and gunicorn worker memory")
+    parser.add_argument("--workers", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8787)
+    args = parser.parse_args()
+
+    print(f"import server: {import_seconds() * 1000:.0f}ms, "
+          f"with numpy loaded for manage-bill: {import_seconds('; import numpy') * 1000:.0f}ms")
+
+    print(f"{'mode':>10} {'boot s':>7} {'RSS MB/worker':>14} {'PSS MB/worker':>14} {'PSS MB total':>13}")
+    for preload in (False, True):
+        elapsed, sizes = boot(args.workers, preload, args.port)
+        rss = statistics.mean(size[0] for size in sizes)
+        pss = [size[1] for size in sizes]
+        print(f"{'preload' if preload else 'default':>10} {elapsed:>7.2f} {rss:>14.1f} {statistics.mean(pss):>14.1f} "
+              f"{sum(pss):>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
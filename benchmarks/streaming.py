@@ -0,0 +1,65 @@
+import sys
+import json
+import resource
+import subprocess
+
+ROW_COUNTS = [10_000, 100_000, 1_000_000]
+BILLS_PER_USER = 5
+
+
+# Rows as the all-users join returns them, generated lazily like a server-side cursor
+def user_rows(n):
+    for i in range(n):
+        for b in range(BILLS_PER_USER):
+            yield f"user{i:07d}", f"Bill {b}", 12.5 + b, False
+
+
+# Previous path: every user and bill materialized, then the whole body serialized at once
+def buffered(n):
+    from server import app
+
+    users = {}
+    for username, name, amount, paid in user_rows(n):
+        users.setdefault(username, []).append({"name": name, "amount": amount, "paid": paid})
+    with app.app_context():
+        body = app.json.dumps({"users": [{"username": key, "bills": value} for key, value in users.items()]})
+    return len(body)
+
+
+# Streamed path: users grouped from the ordered rows and encoded chunk by chunk
+def streamed(n):
+    from server import app
+    from itertools import groupby
+    from streaming import iter_json
+
+    users = ({"username": username, "bills": [{"name": name, "amount": amount, "paid": paid}
+                                               for _, name, amount, paid in rows]}
+             for username, rows in groupby(user_rows(n), key=lambda row: row[0]))
+    with app.app_context():
+        return sum(len(chunk) for chunk in iter_json("users", users))
+
+
+# Function to run one mode in a fresh interpreter so its peak RSS is measured on its own
+def measure(mode, n):
+    output = subprocess.check_output([sys.executable, "-m", "benchmarks.streaming", mode, str(n)])
+    return json.loads(output)
+
+
+def main():
+    if len(sys.argv) == 3:
+        mode, n = sys.argv[1], int(sys.argv[2])
+        size = {"buffered": buffered, "streamed": streamed}[mode](n)
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(json.dumps({"bytes": size, "peak_rss_mb": round(peak_kb / 1024, 1)}))
+        return
+
+    print(f"{'users':>9} {'body MB':>9} {'buffered RSS MB':>16} {'streamed RSS MB':>16}")
+    for n in ROW_COUNTS:
+        buffered_run = measure("buffered", n)
+        streamed_run = measure("streamed", n)
+        print(f"{n:>9} {buffered_run['bytes'] / 1e6:>9.1f} {buffered_run['peak_rss_mb']:>16.1f} "
+              f"{streamed_run['peak_rss_mb']:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
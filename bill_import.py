@@ -0,0 +1,151 @@
+import sys
+import json
+import time
+import argparse
+import psycopg2
+import cache_bus
+from db import connection
+from bill_status import refresh_bill_status
+from psycopg2.extras import execute_values
+
+IMPORT_PAGE_SIZE = 5000
+EXISTING_BILLS_QUERY = "select bill_name from bills where bill_name = any(%(bills)s);"
+EXISTING_USERS_QUERY = "select username from users where username = any(%(usernames)s);"
+
+
+# Function to find what is wrong with a bill of an import payload, None when it can be loaded
+def bill_error(bill, seen):
+    if not isinstance(bill, dict) or not isinstance(bill.get("bill"), str) or bill["bill"] == "":
+        return "Missing bill name"
+    if bill["bill"] in seen:
+        return "Duplicate bill in payload"
+    if not isinstance(bill.get("billGroup"), str):
+        return "Missing bill group"
+    if not isinstance(bill.get("paidBy", ""), str):
+        return "Invalid payer"
+    if not isinstance(bill.get("items"), list) or len(bill["items"]) == 0:
+        return "Missing items"
+
+    item_names = set()
+    for item in bill["items"]:
+        if not isinstance(item, dict):
+            return "Invalid item"
+        if not isinstance(item.get("name"), str) or item["name"] in item_names:
+            return f"Invalid or duplicate item {item.get('name')!r}"
+        if isinstance(item.get("cost"), bool) or not isinstance(item.get("cost"), (int, float)):
+            return f"Invalid cost for item {item['name']!r}"
+        if isinstance(item.get("quantity"), bool) or not isinstance(item.get("quantity"), int):
+            return f"Invalid quantity for item {item['name']!r}"
+        if not isinstance(item.get("type"), str):
+            return f"Invalid type for item {item['name']!r}"
+        item_names.add(item["name"])
+
+    members = bill.get("members", [])
+    if not isinstance(members, list) or not all(isinstance(member, str) for member in members):
+        return "Invalid members"
+    if len(set(members)) != len(members):
+        return "Duplicate members"
+    return None
+
+
+# Function to validate a payload of bills against itself and the stored bills and users
+def validate_bills(cur, bills):
+    errors = {}
+    seen = set()
+    for index, bill in enumerate(bills):
+        error = bill_error(bill, seen)
+        if error is not None:
+            errors[index] = error
+        else:
+            seen.add(bill["bill"])
+
+    cur.execute(EXISTING_BILLS_QUERY, {"bills": list(seen)})
+    existing = {row[0] for row in cur.fetchall()}
+    members = {member for index, bill in enumerate(bills) if index not in errors
+               for member in bill.get("members", []) + ([bill["paidBy"]] if "paidBy" in bill else [])}
+    cur.execute(EXISTING_USERS_QUERY, {"usernames": list(members)})
+    unknown = members - {row[0] for row in cur.fetchall()}
+
+    for index, bill in enumerate(bills):
+        if index in errors:
+            continue
+        if bill["bill"] in existing:
+            errors[index] = "Bill already exists"
+        elif not unknown.isdisjoint(bill.get("members", [])):
+            errors[index] = f"Unknown members {sorted(unknown.intersection(bill['members']))}"
+        elif bill.get("paidBy") in unknown:
+            errors[index] = f"Unknown payer {bill['paidBy']!r}"
+    return errors
+
+
+# Function to create many bills with their items and members in the caller's transaction
+def import_bills(cur, bills):
+    errors = validate_bills(cur, bills)
+    valid = [bill for index, bill in enumerate(bills) if index not in errors]
+
+    # A concurrent writer may have created one of the bills since validation, those rows are skipped
+    inserted = set()
+    if len(valid) != 0:
+        rows = execute_values(cur, "insert into bills (bill_name, bill_group, status, paid_by) values %s\n"
+                                   "on conflict (bill_name) do nothing returning bill_name;",
+                              [(bill["bill"], bill["billGroup"], "open", bill.get("paidBy")) for bill in valid],
+                              page_size=IMPORT_PAGE_SIZE, fetch=True)
+        inserted = {row[0] for row in rows}
+        valid = [bill for bill in valid if bill["bill"] in inserted]
+
+    items = [(bill["bill"], item["name"], item["cost"], item["quantity"], item["type"])
+             for bill in valid for item in bill["items"]]
+    if len(items) != 0:
+        execute_values(cur, "insert into items (bill_name, item_name, cost, quantity, type) values %s;", items,
+                       page_size=IMPORT_PAGE_SIZE)
+    members = [(member, bill["bill"], 0, False, False) for bill in valid for member in bill.get("members", [])]
+    if len(members) != 0:
+        execute_values(cur, "insert into user_bills (username, bill_name, amount, paid, locked) values %s;", members,
+                       page_size=IMPORT_PAGE_SIZE)
+        refresh_bill_status(cur, {bill_name for _, bill_name, _, _, _ in members})
+
+    results = []
+    for index, bill in enumerate(bills):
+        if index in errors:
+            name = bill.get("bill") if isinstance(bill, dict) else None
+            results.append({"bill": name, "success": False, "error": errors[index]})
+        elif bill["bill"] not in inserted:
+            results.append({"bill": bill["bill"], "success": False, "error": "Bill already exists"})
+        else:
+            results.append({"bill": bill["bill"], "success": True, "items": len(bill["items"])})
+    return results
+
+
+# Import bills from a JSON file holding a list of create-bill payloads
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create many bills with their items and members in one transaction")
+    parser.add_argument("path", help="JSON file with a list of {bill, billGroup, items, members} objects")
+    parser.add_argument("--dry-run", action="store_true", help="validate and report without committing")
+    args = parser.parse_args()
+
+    with open(args.path) as file:
+        payload = json.load(file)
+
+    conn = psycopg2.connect(connection)
+    cur = conn.cursor()
+    start = time.perf_counter()
+    results = import_bills(cur, payload)
+    if args.dry_run:
+        conn.rollback()
+    else:
+        # Let running servers evict the bill listings and any bill cached as missing, as the import route does
+        created = [result["bill"] for result in results if result["success"]]
+        if len(created) != 0:
+            cache_bus.publish(cur, "bills", *[f"bill:{bill}" for bill in created])
+        conn.commit()
+    elapsed = time.perf_counter() - start
+    conn.close()
+
+    for result in results:
+        if not result["success"]:
+            print(f"{result['bill']}: {result['error']}")
+    loaded = [result for result in results if result["success"]]
+    item_count = sum(result["items"] for result in loaded)
+    print(f"{len(loaded)}/{len(results)} bills, {item_count} items {'validated' if args.dry_run else 'imported'}"
+          f" in {elapsed:.2f}s ({item_count / elapsed:.0f} items/sec)")
+    sys.exit(0 if len(loaded) == len(results) else 1)
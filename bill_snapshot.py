@@ -0,0 +1,87 @@
+import os
+from cache import TTLCache, response_cache
+
+SNAPSHOT_CACHE_SIZE = int(os.getenv("BILL_SNAPSHOT_CACHE_SIZE", "256"))
+SNAPSHOT_CACHE_TTL = float(os.getenv("BILL_SNAPSHOT_CACHE_TTL", "300"))
+
+snapshot_cache = TTLCache(SNAPSHOT_CACHE_SIZE, SNAPSHOT_CACHE_TTL)
+
+# Members, items and user items of a bill in one query, one row per user item or item without users
+SNAPSHOT_QUERY = ("select b.bill_group, coalesce(m.users, '{}'), i.item_id, i.item_name, i.cost, i.quantity, i.type,\n"
+                  "       ui.username, ui.amount, ui.share\n"
+                  "from bills b\n"
+                  "cross join lateral (select array_agg(username order by username) as users\n"
+                  "                    from user_bills where bill_name=b.bill_name) m\n"
+                  "left join items i on i.bill_name=b.bill_name\n"
+                  "left join user_items ui on ui.item_id=i.item_id\n"
+                  "where b.bill_name=%(bill)s order by i.item_id, ui.username;")
+
+
+# A user's part of an item
+class UserShare:
+    __slots__ = ("username", "amount", "share")
+
+    def __init__(self, username, amount, share):
+        self.username = username
+        self.amount = amount
+        self.share = share
+
+
+# An item of a bill with the shares users hold in it
+class Item:
+    __slots__ = ("item_id", "name", "cost", "quantity", "type", "shares")
+
+    def __init__(self, item_id, name, cost, quantity, item_type):
+        self.item_id = item_id
+        self.name = name
+        self.cost = cost
+        self.quantity = quantity
+        self.type = item_type
+        self.shares = []
+
+
+# A bill with its members and items, as stored when the snapshot was built
+class Bill:
+    __slots__ = ("name", "group", "users", "items")
+
+    def __init__(self, name, group, users, items):
+        self.name = name
+        self.group = group
+        self.users = users
+        self.items = items
+
+
+# Function to build a bill from the rows of the snapshot query
+def build_bill(name, rows):
+    if len(rows) == 0:
+        return None
+
+    items = {}
+    for _, _, item_id, item_name, cost, quantity, item_type, username, amount, share in rows:
+        if item_id is None:
+            continue
+        item = items.get(item_id)
+        if item is None:
+            item = items[item_id] = Item(item_id, item_name, cost, quantity, item_type)
+        if username is not None:
+            item.shares.append(UserShare(username, amount, share))
+    return Bill(name, rows[0][0], tuple(rows[0][1]), tuple(items.values()))
+
+
+# Function to load a bill with one query joining its members, items and user items
+def load_bill(cur, name):
+    cur.execute(SNAPSHOT_QUERY, {"bill": name})
+    return build_bill(name, cur.fetchall())
+
+
+# Function to get a bill from the worker's snapshots, rebuilding it after a write evicted the "bill:<name>" tag
+def get_snapshot(cur, name):
+    versions = response_cache.versions((f"bill:{name}",))
+    entry = snapshot_cache.get(name)
+    if entry is not None and entry[0] == versions:
+        return entry[1]
+
+    bill = load_bill(cur, name)
+    if bill is not None:
+        snapshot_cache.set(name, (versions, bill))
+    return bill
@@ -0,0 +1,91 @@
+import sys
+import json
+import psycopg2
+from db import connection
+
+# Status of a bill derived from its user bills, settled bills keep their status
+STATUS_EXPR = ("case when count(ub.username) = 0 then 'open'"
+               " when bool_and(ub.locked) then 'ready' else 'pending' end")
+
+# Channel notified, on commit, with every status transition
+STATUS_CHANNEL = "bill_status"
+
+LOCK_BILLS_QUERY = "select bill_name from bills where bill_name = any(%(bills)s) order by bill_name for update;"
+BILL_STATUSES_QUERY = "select bill_name, status from bills where bill_name = any(%(bills)s);"
+
+# Stores the derived status and member count of the given bills where they changed
+REFRESH_STATUS_QUERY = (f"update bills b\n"
+                        f"set status=case when b.status='settled' then b.status else s.status end, members=s.members\n"
+                        f"from (select b2.bill_name, {STATUS_EXPR} as status, count(ub.username) as members\n"
+                        f"      from bills b2 left join user_bills ub on ub.bill_name=b2.bill_name\n"
+                        f"      where b2.bill_name = any(%(bills)s) group by b2.bill_name) s\n"
+                        f"where b.bill_name=s.bill_name and (b.members != s.members or\n"
+                        f"      (b.status != 'settled' and b.status != s.status))\n"
+                        f"returning b.bill_name, b.status, b.members;")
+
+
+# Function to notify listeners of (bill, old status, new status, members) transitions when the transaction commits
+def notify_status(cur, transitions):
+    if len(transitions) == 0:
+        return
+    payloads = [json.dumps({"bill": bill_name, "from": old, "to": new, "members": members})
+                for bill_name, old, new, members in transitions]
+    cur.execute("select pg_notify(%s, payload) from unnest(%s::text[]) payload;", (STATUS_CHANNEL, payloads))
+
+
+# Function to lock the given bills, in name order, before their user bills or user items are written
+# Every writer takes the bill rows first, so writers of one bill queue up on them instead of deadlocking on its rows
+def lock_bills(cur, bills):
+    cur.execute(LOCK_BILLS_QUERY, {"bills": list(bills)})
+
+
+# Function to recompute stored status and member count for the given bills, locked by the caller with lock_bills
+def refresh_bill_status(cur, bills):
+    bills = list(bills)
+    if len(bills) == 0:
+        return
+
+    cur.execute(BILL_STATUSES_QUERY, {"bills": bills})
+    before = dict(cur.fetchall())
+    cur.execute(REFRESH_STATUS_QUERY, {"bills": bills})
+    notify_status(cur, [(bill_name, before[bill_name], status, members)
+                        for bill_name, status, members in cur.fetchall() if before[bill_name] != status])
+
+
+# Function to mark a bill as settled, locking it first like every other writer
+def settle_bill(cur, bill):
+    cur.execute("select status, members from bills where bill_name=%s for update;", (bill,))
+    row = cur.fetchone()
+    if row is None or row[0] == "settled":
+        return
+    cur.execute("update bills set status='settled' where bill_name=%s;", (bill,))
+    notify_status(cur, [(bill, row[0], "settled", row[1])])
+
+
+# Function to list bills whose stored status or member count drifted from user_bills
+def find_drift(cur):
+    cur.execute(f"select b.bill_name, b.status, b.members,\n"
+                f"       case when b.status='settled' then b.status else {STATUS_EXPR} end, count(ub.username)\n"
+                f"from bills b left join user_bills ub on ub.bill_name=b.bill_name\n"
+                f"group by b.bill_name, b.status, b.members;")
+    return [row for row in cur.fetchall() if (row[1], row[2]) != (row[3], row[4])]
+
+
+# Check stored bill statuses and optionally repair them
+if __name__ == '__main__':
+    fix = "--fix" in sys.argv[1:]
+    conn = psycopg2.connect(connection)
+    cur = conn.cursor()
+    drift = find_drift(cur)
+    for bill_name, status, members, expected_status, expected_members in drift:
+        print(f"{bill_name}: stored ({status}, {members}) expected ({expected_status}, {expected_members})")
+    print(f"{len(drift)} bills drifted")
+
+    if fix and len(drift) != 0:
+        lock_bills(cur, [row[0] for row in drift])
+        refresh_bill_status(cur, [row[0] for row in drift])
+        print("Bills repaired")
+
+    conn.commit()
+    conn.close()
+    sys.exit(1 if drift and not fix else 0)
@@ -0,0 +1,142 @@
+import os
+import time
+import hashlib
+import threading
+from functools import wraps
+from flask import request, current_app
+from collections import OrderedDict
+
+TAG_MAX_BYTES = 200
+
+
+# Function to shorten a tag longer than TAG_MAX_BYTES, e.g. the tag of a bill with a very long name, to a digest
+# Shortened tags fit the limit, so normalising a tag twice gives the same tag
+def normalize_tag(tag):
+    if len(tag.encode()) <= TAG_MAX_BYTES:
+        return tag
+    return f"{tag[:32]}#{hashlib.sha256(tag.encode()).hexdigest()}"
+
+
+# Bounded LRU cache whose entries also expire after a fixed TTL
+class TTLCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return None if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Per-worker cache of serialized endpoint responses
+# Entries remember the version of every tag they were built from, write routes bump tag versions to evict them
+class ResponseCache:
+    def __init__(self, maxsize, ttl):
+        self.hits = 0
+        self.misses = 0
+        self._entries = TTLCache(maxsize, ttl)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def versions(self, tags):
+        with self._lock:
+            return tuple(self._versions.get(normalize_tag(tag), 0) for tag in tags)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] != self.versions(entry[1]):
+            self._entries.pop(key)
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return entry[2]
+
+    def set(self, key, value, tags, versions):
+        self._entries.set(key, (versions, tags, value))
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in map(normalize_tag, tags):
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries)
+        }
+
+
+response_cache = ResponseCache(int(os.getenv("RESPONSE_CACHE_SIZE", "1024")),
+                               float(os.getenv("RESPONSE_CACHE_TTL", "60")))
+
+
+# Decorator caching a GET route per path and query arguments
+# Tags are formatted with the query arguments, e.g. "bill:{bill}"; responses carry an ETag and honour If-None-Match
+def cached(*tag_templates):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function():
+            key = (request.path, tuple(sorted(request.args.items(multi=True))))
+            entry = response_cache.get(key)
+            if entry is None:
+                tags = tuple(template.format_map(request.args) for template in tag_templates)
+                versions = response_cache.versions(tags)
+                result = f()
+                # Streamed and other prepared responses are passed through uncached
+                if isinstance(result, current_app.response_class):
+                    return result
+                body = current_app.json.dumps(result)
+                entry = (body, hashlib.sha1(body.encode()).hexdigest())
+                response_cache.set(key, entry, tags, versions)
+
+            body, etag = entry
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.response_class(body, mimetype=current_app.json.mimetype)
+            response.set_etag(etag)
+            return response
+
+        return decorated_function
+
+    return decorator
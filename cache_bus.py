@@ -0,0 +1,121 @@
+import os
+import json
+import logging
+import threading
+from db import get_pool
+from cache import response_cache, normalize_tag
+from pg_listener import get_listener
+from bill_snapshot import snapshot_cache
+
+CACHE_CHANNEL = "cache_invalidate"
+CACHE_BUS_RECONCILE = float(os.getenv("CACHE_BUS_RECONCILE", "30"))
+CACHE_BUS_WINDOW = float(os.getenv("CACHE_BUS_WINDOW", "300"))
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+NOTIFY_PAYLOAD_MAX = 7500
+PUBLISH_QUERY = ("insert into cache_versions (tag, version)\n"
+                 "select tag, nextval('cache_version_seq') from unnest(%(tags)s::text[]) tag\n"
+                 "on conflict (tag) do update set version=nextval('cache_version_seq'), changed_at=now()\n"
+                 "returning tag, version;")
+
+logger = logging.getLogger(__name__)
+
+
+# Function to split (tag, version) pairs into JSON arrays of at most NOTIFY_PAYLOAD_MAX bytes
+def notify_payloads(versions):
+    chunks = [[]]
+    size = 2
+    for pair in versions:
+        pair_size = len(json.dumps(pair).encode()) + 2
+        if size + pair_size > NOTIFY_PAYLOAD_MAX and len(chunks[-1]) != 0:
+            chunks.append([])
+            size = 2
+        chunks[-1].append(pair)
+        size += pair_size
+    return [json.dumps(chunk) for chunk in chunks]
+
+
+# Function to publish changed cache tags from a write transaction, delivered to every worker when it commits
+# Each tag gets a new version so workers that miss the notification still notice the change when they reconcile
+# An existing tag takes its version while its row is locked, so versions of a tag grow in commit order
+def publish(cur, *tags):
+    tags = sorted(set(map(normalize_tag, tags)))
+    if len(tags) == 0:
+        return
+    cur.execute(PUBLISH_QUERY, {"tags": tags})
+    cur.execute("select pg_notify(%s, payload) from unnest(%s::text[]) payload;",
+                (CACHE_CHANNEL, notify_payloads(cur.fetchall())))
+
+
+# Worker side of the bus, evicting the local caches for tags changed by any worker
+class CacheBus:
+    def __init__(self, reconcile_interval=CACHE_BUS_RECONCILE, window=CACHE_BUS_WINDOW):
+        self.reconcile_interval = reconcile_interval
+        self.window = window
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            listener = get_listener()
+            listener.on_reconnect(self.flush)
+            listener.subscribe(CACHE_CHANNEL, self.receive)
+            self._thread = threading.Thread(target=self._run, name="cache-bus", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def receive(self, channel, payload):
+        self.apply(json.loads(payload))
+
+    # Function to evict every tag whose version is newer than the one last seen
+    def apply(self, versions):
+        with self._lock:
+            changed = [tag for tag, version in versions if self._versions.get(tag, -1) < version]
+            self._versions.update((tag, version) for tag, version in versions if tag in changed)
+        if len(changed) != 0:
+            response_cache.invalidate(*changed)
+
+    # Notifications sent while the listener was disconnected are lost, so everything cached may be stale
+    def flush(self):
+        response_cache.clear()
+        snapshot_cache.clear()
+
+    # Function to compare the tags changed within the window against those seen, catching missed notifications
+    def reconcile(self):
+        pool = get_pool()
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("select tag, version from cache_versions\n"
+                            "where changed_at > now() - %s * interval '1 second';", (self.window,))
+                versions = cur.fetchall()
+            conn.commit()
+        finally:
+            pool.putconn(conn)
+        self.apply(versions)
+
+    def _run(self):
+        while not self._stop.wait(self.reconcile_interval):
+            try:
+                self.reconcile()
+            except Exception:
+                logger.exception("Cache bus reconcile failed")
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+# Function to start the worker's cache bus once, or return the running one
+def start_bus():
+    global _bus
+    with _bus_lock:
+        if _bus is None:
+            _bus = CacheBus()
+            _bus.start()
+    return _bus
@@ -0,0 +1,160 @@
+import os
+import time
+import threading
+import encoding
+import psycopg2
+from flask import g, has_app_context
+from dotenv import load_dotenv
+
+load_dotenv()
+
+connection = f"dbname=bill_splitter_db user={os.getenv('DB_USER')} password={os.getenv('DB_PASSWORD')}"
+
+POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "5"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+POOL_HEALTH_CHECK = float(os.getenv("DB_POOL_HEALTH_CHECK", "30"))
+
+
+# Cursor recording query count, time spent in the database and rows returned for the current request
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        if not has_app_context():
+            return super().execute(query, vars)
+
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            g.query_count = g.get("query_count", 0) + 1
+            g.db_time = g.get("db_time", 0) + time.perf_counter() - start
+            if self.description is not None and self.rowcount > 0:
+                g.rows_fetched = g.get("rows_fetched", 0) + self.rowcount
+            if "sql_log" in g and self.query is not None:
+                g.sql_log.append(self.query.decode(errors="replace"))
+
+
+# Error raised when no connection frees up within the checkout timeout
+class PoolTimeout(Exception):
+    pass
+
+
+# Bounded pool of idle connections, safe to share between threads
+class ConnectionPool:
+    def __init__(self, dsn, min_size=POOL_MIN, max_size=POOL_MAX, timeout=POOL_TIMEOUT,
+                 health_check=POOL_HEALTH_CHECK):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check = health_check
+        self._idle = []
+        self._size = 0
+        self._lock = threading.Condition()
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, cursor_factory=InstrumentedCursor)
+        encoding.register(conn)
+        return conn
+
+    # Ping a connection that sat idle for longer than the health check interval
+    def _healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("select 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            conn.close()
+            return False
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        with self._lock:
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._lock.wait(remaining):
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+            if self._idle:
+                conn, idle_since = self._idle.pop()
+            else:
+                conn, idle_since = None, 0
+            self._size += 1 if conn is None else 0
+
+        if conn is not None and self._healthy(conn, idle_since):
+            return conn
+        try:
+            return self._connect()
+        except psycopg2.Error:
+            with self._lock:
+                self._size -= 1
+                self._lock.notify()
+            raise
+
+    def putconn(self, conn):
+        if not conn.closed and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                conn.close()
+
+        with self._lock:
+            if conn.closed:
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+
+    def closeall(self):
+        with self._lock:
+            for conn, _ in self._idle:
+                conn.close()
+            self._size -= len(self._idle)
+            self._idle = []
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_inherited_pools = []
+
+
+# Function to get the worker's connection pool, created on first use in every process
+# A pool inherited through fork, e.g. from a preloading gunicorn master, is kept but never used or closed: its sockets
+# belong to the parent, and closing them from the child would end the parent's sessions
+def get_pool():
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                if _pool is not None:
+                    _inherited_pools.append(_pool)
+                _pool = ConnectionPool(connection)
+                _pool_pid = os.getpid()
+    return _pool
+
+
+# Function to get the connection bound to the current request
+def get_conn():
+    if "db_conn" not in g:
+        g.db_conn = get_pool().getconn()
+    return g.db_conn
+
+
+# Function to hand the request connection back to the pool
+def release_conn(exception=None):
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        get_pool().putconn(conn)
+
+
+# Function to map the remaining cursor rows to records keyed by output columns
+def fetch_records(cur, output_cols):
+    return [dict(zip(output_cols, row)) for row in cur]
@@ -1,88 +1,39 @@
+import io
 import os
+import re
+import csv
 import json
+import time
+import argparse
 import psycopg2
-import pandas as pd
+import migrations
+from itertools import islice
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
 
 load_dotenv()
 
+parser = argparse.ArgumentParser(description="Create bill_splitter_db and load the Database/*.json exports")
+parser.add_argument("--resume", action="store_true", help="continue an interrupted load instead of starting over")
+parser.add_argument("--jobs", type=int, default=3, help="tables loaded in parallel")
+parser.add_argument("--batch", type=int, default=50000, help="rows copied per transaction")
+args = parser.parse_args()
+
+database = "bill_splitter_db"
+credentials = f"user={os.getenv('DB_USER')} password={os.getenv('DB_PASSWORD')}"
+
 
 # Creating Database
-conn_ = psycopg2.connect(f"dbname=postgres user={os.getenv('DB_USER')} password={os.getenv('DB_PASSWORD')}")
+conn_ = psycopg2.connect(f"dbname=postgres {credentials}")
 conn_.autocommit = True
 cur_ = conn_.cursor()
-database = "bill_splitter_db"
-cur_.execute(f"CREATE database {database}")
+cur_.execute("SELECT 1 FROM pg_database WHERE datname=%s", (database,))
+if cur_.fetchone() is None:
+    cur_.execute(f"CREATE database {database}")
+    print("Database created")
+elif not args.resume:
+    raise SystemExit(f"Database {database} already exists, use --resume to continue loading it")
 conn_.close()
-print("Database created")
-
-
-# Generating data for tables
-# Bills Table
-with open("Database/bills.json") as file:
-    bills_j = json.load(file)
-
-bills_c = {
-    "name": [],
-    "group": [],
-    "status": []
-}
-
-for bill in bills_j:
-    bills_c["name"].append(bill["name"])
-    bills_c["group"].append(bill["group"])
-    bills_c["status"].append(bill["status"])
-
-pd.DataFrame(bills_c).to_csv("Database/bills.csv", index=False)
-
-# Items Table
-items_c = {
-    "bill_name": [],
-    "name": [],
-    "cost": [],
-    "quantity": [],
-    "type": []
-}
-
-for bill in bills_j:
-    for item in bill["items"]:
-        items_c["bill_name"].append(bill["name"])
-        items_c["name"].append(item["name"])
-        items_c["cost"].append(item["cost"])
-        items_c["quantity"].append(item["quantity"])
-        items_c["type"].append(item["type"])
-
-pd.DataFrame(items_c).to_csv("Database/items.csv", index=False)
-
-# Users Table
-with open("Database/users.json") as file:
-    users_j = json.load(file)
-with open("Database/userGroups.json") as file:
-    groups_j = json.load(file)
-
-user_groups = {}
-for group in groups_j:
-    for user in group["users"]:
-        user_groups[user] = group["name"]
-
-user_c = {
-    "username": [],
-    "first_name": [],
-    "last_name": [],
-    "password": [],
-    "user_group": []
-}
-
-for user in users_j:
-    user_c["username"].append(user["username"])
-    user_c["first_name"].append(user["firstName"])
-    user_c["last_name"].append(user["lastName"])
-    user_c["password"].append(user["password"])
-    user_c["user_group"].append(user_groups[user["username"]])
-
-pd.DataFrame(user_c).to_csv("Database/users.csv", index=False)
-
-print("CSV files created")
 
 
 # Generating Tables
@@ -93,20 +44,11 @@ def create_cols(cols):
 def create_table(name, cols, primary, col_id=""):
     if col_id != "":
         col_id += " serial, "
-    conn = psycopg2.connect(f"dbname={database} user={os.getenv('DB_USER')} password={os.getenv('DB_PASSWORD')}")
+    conn = psycopg2.connect(f"dbname={database} {credentials}")
     cur = conn.cursor()
-    cur.execute(f"CREATE TABLE {name}({col_id}{create_cols(cols)}, PRIMARY KEY ({primary}))")
-    if not name.startswith("user_"):
-        col_names = ", ".join(cols.keys())
-        add_csv_q = (
-            f"COPY {name}({col_names})"
-            f"FROM '{os.getcwd()}/Database/{name}.csv'"
-            f"DELIMITER ','"
-            f"CSV HEADER;"
-        )
-        cur.execute(add_csv_q)
+    cur.execute(f"CREATE TABLE IF NOT EXISTS {name}({col_id}{create_cols(cols)}, PRIMARY KEY ({primary}))")
     conn.commit()
-    conn_.close()
+    conn.close()
 
 
 # Users Table
@@ -151,4 +93,148 @@ create_table("user_items", {
     "share": "numeric"
 }, "username, item_id")
 
+# Load progress, updated in the same transaction as every copied batch
+create_table("load_progress", {
+    "table_name": "text",
+    "rows_loaded": "bigint"
+}, "table_name")
+
 print("Tables created")
+
+
+ELEMENT_END = re.compile(r"\s*[,\]]")
+
+
+# Function to stream the elements of a top-level JSON array without reading the whole file
+def iter_json_array(path, chunk_size=1 << 20):
+    decoder = json.JSONDecoder()
+    with open(path) as file:
+        buffer = file.read(chunk_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} does not contain a JSON array")
+        pos = 1
+        eof = False
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+            try:
+                if pos == len(buffer):
+                    raise ValueError("Buffer exhausted")
+                element, end = decoder.raw_decode(buffer, pos)
+                if end == len(buffer) and not eof:
+                    raise ValueError("Element may continue in the next chunk")
+                # A number cut by the chunk, e.g. "1." of "1.5", parses as a shorter number, so a number, true, false
+                # or null is only complete once the separator after it has been read
+                if not eof and not isinstance(element, (dict, list, str)) and not ELEMENT_END.match(buffer, end):
+                    raise ValueError("Element may continue in the next chunk")
+            except ValueError:
+                if eof:
+                    raise
+                chunk = file.read(chunk_size)
+                eof = chunk == ""
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield element
+            pos = end
+
+
+# File-like object producing CSV text from an iterator of rows as COPY reads it
+class CopyStream:
+    def __init__(self, rows):
+        self.rows = rows
+        self.count = 0
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+        self._pending = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._pending) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self._writer.writerow(row)
+            self.count += 1
+            if self._buffer.tell() >= 1 << 16:
+                self._pending += self._buffer.getvalue()
+                self._buffer.seek(0)
+                self._buffer.truncate()
+        self._pending += self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        if size < 0:
+            size = len(self._pending)
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+
+# Function to stream rows into a table in committed batches, skipping rows loaded by an earlier run
+def copy_rows(table, cols, rows, batch_size):
+    conn = psycopg2.connect(f"dbname={database} {credentials}")
+    cur = conn.cursor()
+    cur.execute("SELECT rows_loaded FROM load_progress WHERE table_name=%s", (table,))
+    done = cur.fetchone()
+    loaded = 0 if done is None else done[0]
+    rows = islice(rows, loaded, None)
+
+    start = time.perf_counter()
+    copied = 0
+    while True:
+        batch = CopyStream(row for _, row in zip(range(batch_size), rows))
+        cur.copy_expert(f"COPY {table}({', '.join(cols)}) FROM STDIN WITH (FORMAT csv)", batch)
+        if batch.count == 0:
+            break
+        loaded += batch.count
+        copied += batch.count
+        cur.execute("INSERT INTO load_progress (table_name, rows_loaded) VALUES (%s, %s)"
+                    " ON CONFLICT (table_name) DO UPDATE SET rows_loaded=excluded.rows_loaded", (table, loaded))
+        conn.commit()
+        print(f"{table}: {loaded} rows loaded ({copied / (time.perf_counter() - start):.0f} rows/sec)")
+    conn.commit()
+    conn.close()
+    return loaded
+
+
+# Generating data for tables
+def user_rows():
+    user_groups = {}
+    for group in iter_json_array("Database/userGroups.json"):
+        for user in group["users"]:
+            user_groups[user] = group["name"]
+
+    for user in iter_json_array("Database/users.json"):
+        yield (user["username"], user["firstName"], user["lastName"], user["password"],
+               user_groups[user["username"]])
+
+
+def bill_rows():
+    for bill in iter_json_array("Database/bills.json"):
+        yield bill["name"], bill["group"], bill["status"]
+
+
+def item_rows():
+    for bill in iter_json_array("Database/bills.json"):
+        for item in bill["items"]:
+            yield bill["name"], item["name"], item["cost"], item["quantity"], item["type"]
+
+
+loads = [
+    ("users", ["username", "first_name", "last_name", "password", "user_group"], user_rows),
+    ("bills", ["bill_name", "bill_group", "status"], bill_rows),
+    ("items", ["bill_name", "item_name", "cost", "quantity", "type"], item_rows)
+]
+
+with ThreadPoolExecutor(args.jobs) as executor:
+    futures = [executor.submit(copy_rows, table, cols, rows(), args.batch) for table, cols, rows in loads]
+    totals = [future.result() for future in futures]
+
+print("Data loaded: " + ", ".join(f"{table} {total} rows" for (table, _, _), total in zip(loads, totals)))
+
+
+# Columns, tables and indexes maintained by the server, applied after the bulk load so indexes are built once
+conn = psycopg2.connect(f"dbname={database} {credentials}")
+for version, name in migrations.upgrade(conn):
+    print(f"Applied migration {version}: {name}")
+conn.close()
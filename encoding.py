@@ -0,0 +1,80 @@
+import os
+import json
+import psycopg2
+from decimal import Decimal
+from dotenv import load_dotenv
+from psycopg2.extras import register_default_jsonb
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+load_dotenv()
+
+# "float" decodes numeric columns to float, "cents" to exact Decimals written with at least two decimal places
+NUMERIC_MODE = os.getenv("NUMERIC_MODE", "float")
+CENT = Decimal("0.01")
+
+
+# Function to write a Decimal with at least two decimal places, e.g. 12.5 as 12.50
+# Values with more places, such as shares saved with more precision, are kept as they are instead of rounded
+def to_cents(value):
+    value = Decimal(value)
+    if value.as_tuple().exponent > CENT.as_tuple().exponent:
+        return value.quantize(CENT)
+    return value
+
+
+# Function to decode a numeric value in the configured representation
+def decode_numeric(value, cur):
+    if value is None:
+        return None
+    if NUMERIC_MODE == "cents":
+        return to_cents(value)
+    return float(value)
+
+
+NUMERIC = psycopg2.extensions.new_type(psycopg2.extensions.DECIMAL.values, "NUMERIC", decode_numeric)
+
+
+# Function to decode numeric columns, and numbers in jsonb columns, of a connection in the configured representation
+# The only jsonb column holds ledger amounts, so its numbers are written in cents like the numeric columns
+def register(conn):
+    psycopg2.extensions.register_type(NUMERIC, conn)
+    if NUMERIC_MODE == "cents":
+        register_default_jsonb(conn, loads=lambda value: json.loads(value, parse_float=to_cents, parse_int=to_cents))
+
+
+# JSON provider encoding responses with orjson, or with Flask's encoder when orjson is not installed
+# Decimals are written out digit for digit, so cents keep their exact value on the wire
+class FastJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            kwargs.setdefault("default", self.fallback_default)
+            return super().dumps(obj, **kwargs)
+
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.orjson_default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    @staticmethod
+    def orjson_default(value):
+        if isinstance(value, Decimal):
+            return orjson.Fragment(str(value))
+        return DefaultJSONProvider.default(value)
+
+    @staticmethod
+    def fallback_default(value):
+        if isinstance(value, Decimal):
+            return float(value)
+        return DefaultJSONProvider.default(value)
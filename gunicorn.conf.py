@@ -1,9 +1,79 @@
 import os
+import gc
+import multiprocessing
 from dotenv import load_dotenv
 
 load_dotenv()
 
 LOCAL_IP = os.getenv('LOCAL_IP')
 
+WORKER_MODE = os.getenv("GUNICORN_WORKER_MODE", "sync")
+CPUS = multiprocessing.cpu_count()
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "5"))
+
 bind = LOCAL_IP
-workers = 10
+
+# Event streams (/api/bill-events) a worker serves at once, on top of the capacity sized for API requests below
+# A sync worker would spend itself on one stream until the worker timeout kills it, so sync serves none
+SSE_DEFAULTS = {"sync": 0, "gthread": 20, "gevent": 200}
+
+# sync: one request at a time per process, so run enough processes to keep the CPUs busy while others wait on I/O
+# gthread: one process per CPU, with a thread for every pooled connection so no thread waits on the pool, plus one
+#          for every event stream
+# gevent: one process per CPU, serving greenlets up to twice the pool size so requests that are not in a query
+#         (e.g. streaming a response) do not hold back those that are, plus one for every event stream
+if WORKER_MODE not in SSE_DEFAULTS:
+    raise ValueError(f"Unknown GUNICORN_WORKER_MODE {WORKER_MODE!r}, use sync, gthread or gevent")
+SSE_CLIENTS = int(os.getenv("SSE_MAX_CLIENTS", str(SSE_DEFAULTS[WORKER_MODE])))
+raw_env = [f"SSE_MAX_CLIENTS={SSE_CLIENTS}"]
+
+if WORKER_MODE == "sync":
+    workers = int(os.getenv("GUNICORN_WORKERS", str(2 * CPUS + 1)))
+elif WORKER_MODE == "gthread":
+    worker_class = "gthread"
+    workers = int(os.getenv("GUNICORN_WORKERS", str(CPUS)))
+    threads = int(os.getenv("GUNICORN_THREADS", str(POOL_MAX))) + SSE_CLIENTS
+else:
+    worker_class = "gevent"
+    workers = int(os.getenv("GUNICORN_WORKERS", str(CPUS)))
+    worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", str(2 * POOL_MAX))) + SSE_CLIENTS
+
+# Import the app once in the master so workers share its memory copy-on-write instead of importing it each
+# gevent workers patch the standard library when they start, which has to happen before the app is imported
+preload_app = os.getenv("GUNICORN_PRELOAD", "0") == "1" and WORKER_MODE != "gevent"
+
+
+# Clear request metrics of previous runs before the workers start writing theirs
+def on_starting(server):
+    import metrics
+
+    metrics.reset()
+
+
+# Import what workers load lazily while still in the master, then keep the collector off the shared objects
+# Without freezing, the first collection in every worker touches, and so copies, each page of the preloaded heap
+def when_ready(server):
+    if preload_app:
+        import numpy
+
+        if os.getenv("NOTIFY_TRANSPORT", "twilio") == "twilio":
+            import twilio.rest
+
+        gc.freeze()
+
+
+# Start the notification dispatcher and the cache bus in every worker
+# Under gevent, psycopg2 is also made to yield to other greenlets while it waits on the database
+# This runs once the worker is initialised, which for gevent workers is after they patch the standard library, so
+# the app and its locks are loaded patched and the threads started here are greenlets
+def post_worker_init(worker):
+    import cache_bus
+    import notifications
+
+    if WORKER_MODE == "gevent":
+        from psycogreen.gevent import patch_psycopg
+
+        patch_psycopg()
+
+    notifications.start_dispatcher()
+    cache_bus.start_bus()
@@ -0,0 +1,56 @@
+import sys
+import psycopg2
+from db import connection
+
+# Outstanding total and unpaid bills of each user, computed from user_bills
+LEDGER_BILL = "jsonb_build_object('name', ub.bill_name, 'amount', ub.amount, 'paid', ub.paid)"
+LEDGER_SELECT = (f"select u.username, coalesce(sum(ub.amount), 0) as outstanding,\n"
+                 f"       coalesce(jsonb_agg({LEDGER_BILL} order by ub.bill_name)\n"
+                 f"                filter (where ub.bill_name is not null), '[]') as bills\n"
+                 f"from users u left join user_bills ub\n"
+                 f"on ub.username=u.username and ub.amount!=0 and ub.paid=false\n")
+LOCK_LEDGER_QUERY = "select username from user_ledger where username = any(%(usernames)s) order by username for update;"
+REFRESH_LEDGER_QUERY = (f"insert into user_ledger (username, outstanding, bills)\n"
+                        f"{LEDGER_SELECT}where u.username = any(%(usernames)s) group by u.username\n"
+                        f"on conflict (username) do update set outstanding=excluded.outstanding, bills=excluded.bills\n"
+                        f"where (user_ledger.outstanding, user_ledger.bills) is distinct from"
+                        f" (excluded.outstanding, excluded.bills);")
+
+
+# Function to recompute the ledger rows of the given users
+def refresh_ledger(cur, usernames):
+    usernames = list(usernames)
+    if len(usernames) == 0:
+        return
+
+    # Lock the ledger rows so concurrent writers recompute one after the other from committed amounts
+    cur.execute(LOCK_LEDGER_QUERY, {"usernames": usernames})
+    cur.execute(REFRESH_LEDGER_QUERY, {"usernames": usernames})
+
+
+# Function to list users whose ledger row is missing or drifted from user_bills
+def find_drift(cur):
+    cur.execute(f"select s.username, l.outstanding, s.outstanding\n"
+                f"from ({LEDGER_SELECT}group by u.username) s\n"
+                f"left join user_ledger l on l.username=s.username\n"
+                f"where (l.outstanding, l.bills) is distinct from (s.outstanding, s.bills);")
+    return cur.fetchall()
+
+
+# Check the ledger against user_bills and optionally rebuild it
+if __name__ == '__main__':
+    rebuild = "--rebuild" in sys.argv[1:]
+    conn = psycopg2.connect(connection)
+    cur = conn.cursor()
+    drift = find_drift(cur)
+    for username, outstanding, expected in drift:
+        print(f"{username}: stored {outstanding} expected {expected}")
+    print(f"{len(drift)} ledger rows drifted")
+
+    if rebuild and len(drift) != 0:
+        refresh_ledger(cur, [row[0] for row in drift])
+        print("Ledger rebuilt")
+
+    conn.commit()
+    conn.close()
+    sys.exit(1 if drift and not rebuild else 0)
@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import bisect
+import tempfile
+import threading
+from flask import g, request, current_app
+
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "bill-splitter-metrics"))
+METRICS_FLUSH = float(os.getenv("METRICS_FLUSH", "2"))
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 1000, 10000, 100000)
+
+HISTOGRAMS = {
+    "request_seconds": ("Time from request start to teardown", SECONDS_BUCKETS),
+    "db_seconds": ("Time spent executing queries", SECONDS_BUCKETS),
+    "queries": ("Queries executed per request", COUNT_BUCKETS),
+    "rows": ("Rows returned by queries per request", COUNT_BUCKETS)
+}
+
+
+# Histogram of observations with fixed upper bounds, mergeable across workers
+class Histogram:
+    def __init__(self, buckets, counts=None, total=0.0):
+        self.buckets = buckets
+        self.counts = counts or [0] * (len(buckets) + 1)
+        self.total = total
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other["counts"])]
+        self.total += other["total"]
+
+    def to_dict(self):
+        return {"counts": self.counts, "total": self.total}
+
+
+# Per route histograms of one worker, flushed to a file per process so any worker can serve the totals
+class Registry:
+    def __init__(self, directory=METRICS_DIR, flush_interval=METRICS_FLUSH):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.routes = {}
+        self._last_flush = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def observe(self, route, values):
+        with self._lock:
+            histograms = self.routes.get(route)
+            if histograms is None:
+                histograms = {name: Histogram(buckets) for name, (_, buckets) in HISTOGRAMS.items()}
+                self.routes[route] = histograms
+            for name, value in values.items():
+                histograms[name].observe(value)
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {route: {name: histogram.to_dict() for name, histogram in histograms.items()}
+                    for route, histograms in self.routes.items()}
+
+    def flush(self):
+        with self._flush_lock:
+            self._last_flush = time.monotonic()
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{os.getpid()}.json")
+            with open(path + ".tmp", "w") as file:
+                json.dump(self.snapshot(), file)
+            os.replace(path + ".tmp", path)
+
+    # Function to merge the latest snapshot of every worker
+    def collect(self):
+        self.flush()
+        merged = {}
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as file:
+                    snapshot = json.load(file)
+            except (OSError, ValueError):
+                continue
+            for route, histograms in snapshot.items():
+                target = merged.setdefault(route, {key: Histogram(buckets)
+                                                   for key, (_, buckets) in HISTOGRAMS.items()})
+                for key, data in histograms.items():
+                    target[key].merge(data)
+        return merged
+
+    # Function to render the merged histograms in the Prometheus text format
+    def render(self):
+        merged = self.collect()
+        lines = []
+        for name, (description, buckets) in HISTOGRAMS.items():
+            metric = f"bill_splitter_{name}"
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} histogram")
+            for route, histograms in sorted(merged.items()):
+                histogram = histograms[name]
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{route="{route}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{route="{route}"}} {histogram.total}')
+                lines.append(f'{metric}_count{{route="{route}"}} {cumulative}')
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+# Function to mark the start of a request, kept in its environ so nested request contexts are not recorded
+def start_timer():
+    request.environ["metrics.start"] = time.perf_counter()
+    if SLOW_REQUEST_MS > 0:
+        g.sql_log = []
+
+
+# Function to record a finished request and log it when it was slow
+def record_request(exception=None):
+    if "metrics.start" not in request.environ:
+        return
+    elapsed = time.perf_counter() - request.environ["metrics.start"]
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    registry.observe(route, {
+        "request_seconds": elapsed,
+        "db_seconds": g.get("db_time", 0),
+        "queries": g.get("query_count", 0),
+        "rows": g.get("rows_fetched", 0)
+    })
+
+    if SLOW_REQUEST_MS > 0 and elapsed * 1000 >= SLOW_REQUEST_MS:
+        statements = "\n".join(g.get("sql_log", []))
+        current_app.logger.warning(f"Slow request {request.method} {request.full_path} took {elapsed * 1000:.1f}ms "
+                                   f"({g.get('query_count', 0)} queries, {g.get('db_time', 0) * 1000:.1f}ms in "
+                                   f"database):\n{statements}")
+
+
+# Function to hook request timing into a Flask app
+def init_app(app):
+    app.before_request(start_timer)
+    app.teardown_request(record_request)
+
+
+# Function to drop the snapshots left behind by earlier server runs
+def reset():
+    if os.path.isdir(METRICS_DIR):
+        for name in os.listdir(METRICS_DIR):
+            os.remove(os.path.join(METRICS_DIR, name))
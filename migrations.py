@@ -0,0 +1,123 @@
+import sys
+import psycopg2
+from db import connection
+
+# Schema changes applied after the tables created by db_setup.py, in version order
+# Their SQL is written out in full, so later changes to the app's queries never change what a migration does
+MIGRATIONS = [
+    (1, "bill status and member count", [
+        "alter table bills add column if not exists members int default 0 not null;",
+        "update bills b\n"
+        "set status=case when b.status='settled' then b.status else s.status end, members=s.members\n"
+        "from (select b2.bill_name, case when count(ub.username) = 0 then 'open'"
+        " when bool_and(ub.locked) then 'ready' else 'pending' end as status, count(ub.username) as members\n"
+        "      from bills b2 left join user_bills ub on ub.bill_name=b2.bill_name group by b2.bill_name) s\n"
+        "where b.bill_name=s.bill_name;"
+    ]),
+    (2, "notification outbox", [
+        "create table if not exists notification_outbox(id serial, recipient text not null, body text not null,"
+        " status text default 'pending' not null, attempts int default 0 not null, last_error text,"
+        " next_attempt_at timestamptz default now() not null, created_at timestamptz default now() not null,"
+        " primary key (id));",
+        "create index if not exists notification_outbox_pending_idx on notification_outbox (next_attempt_at)"
+        " where status='pending';"
+    ]),
+    (3, "hot path indexes", [
+        "create index if not exists items_bill_name_idx on items (bill_name) include (item_name);",
+        "create index if not exists user_bills_bill_name_idx on user_bills (bill_name)"
+        " include (locked, amount, paid);",
+        "create index if not exists user_bills_unpaid_idx on user_bills (username) include (bill_name, amount)"
+        " where amount!=0 and paid=false;",
+        "create index if not exists user_items_item_id_idx on user_items (item_id);",
+        "create index if not exists users_user_group_idx on users (user_group) include (username);",
+        "analyze items, user_bills, user_items, users;"
+    ]),
+    (4, "keyset pagination indexes", [
+        "create or replace function bill_status_rank(status text) returns int language sql immutable as\n"
+        "$$ select array_position(array['ready', 'pending', 'open', 'settled'], status) $$;",
+        "create index if not exists bills_status_rank_idx on bills (bill_status_rank(status), bill_name)"
+        " include (status, members);",
+        "create index if not exists bills_group_status_rank_idx on bills"
+        " (bill_group, bill_status_rank(status), bill_name) include (status, members);",
+        "create index if not exists users_group_username_idx on users (user_group, username);",
+        "analyze bills, users;"
+    ]),
+    (5, "user ledger", [
+        "create table if not exists user_ledger(username text, outstanding numeric default 0 not null,"
+        " bills jsonb default '[]' not null, primary key (username));",
+        "insert into user_ledger (username, outstanding, bills)\n"
+        "select u.username, coalesce(sum(ub.amount), 0) as outstanding,\n"
+        "       coalesce(jsonb_agg(jsonb_build_object('name', ub.bill_name, 'amount', ub.amount, 'paid', ub.paid)"
+        " order by ub.bill_name)\n"
+        "                filter (where ub.bill_name is not null), '[]') as bills\n"
+        "from users u left join user_bills ub\n"
+        "on ub.username=u.username and ub.amount!=0 and ub.paid=false\n"
+        "group by u.username\n"
+        "on conflict (username) do update set outstanding=excluded.outstanding, bills=excluded.bills;"
+    ]),
+    (6, "bill payer", [
+        "alter table bills add column if not exists paid_by text;"
+    ]),
+    (7, "cache versions", [
+        "create sequence if not exists cache_version_seq;",
+        "create table if not exists cache_versions(tag text, version bigint not null,"
+        " changed_at timestamptz default now() not null, primary key (tag));",
+        "create index if not exists cache_versions_changed_at_idx on cache_versions (changed_at);"
+    ]),
+    (8, "clear delivered notification bodies", [
+        "alter table notification_outbox alter column body drop not null;",
+        "update notification_outbox set body=null where status!='pending';"
+    ])
+]
+
+
+# Function to get the applied schema version, creating the version table when missing
+def current_version(cur):
+    cur.execute("create table if not exists schema_migrations (version int primary key, name text not null,"
+                " applied_at timestamptz default now() not null);")
+    cur.execute("select coalesce(max(version), 0) from schema_migrations;")
+    return cur.fetchone()[0]
+
+
+# Function to apply every pending migration, each in its own transaction
+def upgrade(conn, target=None):
+    cur = conn.cursor()
+    # Serialise concurrent runners, e.g. several deploys starting at once
+    cur.execute("select pg_advisory_lock(hashtext('schema_migrations'));")
+    try:
+        version = current_version(cur)
+        conn.commit()
+        applied = []
+        for number, name, statements in MIGRATIONS:
+            if number <= version or (target is not None and number > target):
+                continue
+            for statement in statements:
+                cur.execute(statement)
+            cur.execute("insert into schema_migrations (version, name) values (%s, %s);", (number, name))
+            conn.commit()
+            applied.append((number, name))
+        return applied
+    finally:
+        conn.rollback()
+        cur.execute("select pg_advisory_unlock(hashtext('schema_migrations'));")
+        conn.commit()
+
+
+# Upgrade the database or show its version
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+    conn_ = psycopg2.connect(connection)
+    if command == "status":
+        version_ = current_version(conn_.cursor())
+        conn_.commit()
+        print(f"Schema version {version_}, latest {MIGRATIONS[-1][0]}")
+        for number_, name_, _ in MIGRATIONS:
+            print(f"{'applied' if number_ <= version_ else 'pending'}  {number_:>3}  {name_}")
+    elif command == "upgrade":
+        target_ = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        for number_, name_ in upgrade(conn_, target_):
+            print(f"Applied migration {number_}: {name_}")
+        print("Schema up to date")
+    else:
+        sys.exit("Usage: python migrations.py [upgrade [version] | status]")
+    conn_.close()
@@ -0,0 +1,171 @@
+import os
+import logging
+import threading
+import psycopg2
+from db import connection
+from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+
+load_dotenv()
+
+NOTIFY_TRANSPORT = os.getenv("NOTIFY_TRANSPORT", "twilio")
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", "4"))
+NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", "20"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+NOTIFY_BACKOFF = float(os.getenv("NOTIFY_BACKOFF", "2"))
+NOTIFY_POLL_INTERVAL = float(os.getenv("NOTIFY_POLL_INTERVAL", "5"))
+
+logger = logging.getLogger(__name__)
+
+
+# Sends WhatsApp messages through Twilio
+class TwilioTransport:
+    def __init__(self):
+        self.client = None
+        self.sender = os.getenv('TWILIO_PHONE')
+        self._lock = threading.Lock()
+
+    # Function to create the client, and import twilio with it, when the first message is sent
+    def get_client(self):
+        with self._lock:
+            if self.client is None:
+                from twilio.rest import Client
+
+                self.client = Client(os.getenv('ACCT_SID'), os.getenv('TWILIO_AUTH'))
+        return self.client
+
+    def send(self, recipient, body):
+        message = self.get_client().messages.create(
+            from_=f"whatsapp:{self.sender}",
+            body=body,
+            to=f"whatsapp:{recipient}"
+        )
+        return message.status
+
+
+# Keeps messages in memory instead of sending them, for local runs and tests
+class FakeTransport:
+    def __init__(self):
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send(self, recipient, body):
+        with self._lock:
+            self.sent.append((recipient, body))
+        return "delivered"
+
+
+TRANSPORTS = {
+    "twilio": TwilioTransport,
+    "fake": FakeTransport
+}
+
+
+# Function to queue a message in the outbox as part of the caller's transaction
+def enqueue(cur, recipient, body):
+    cur.execute("insert into notification_outbox (recipient, body) values (%s, %s);", (recipient, body))
+
+
+# Background thread delivering pending outbox messages with bounded concurrency and retries
+class Dispatcher:
+    def __init__(self, transport, concurrency=NOTIFY_CONCURRENCY, batch_size=NOTIFY_BATCH_SIZE,
+                 max_attempts=NOTIFY_MAX_ATTEMPTS, backoff=NOTIFY_BACKOFF, poll_interval=NOTIFY_POLL_INTERVAL):
+        self.transport = transport
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(concurrency, thread_name_prefix="notify")
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._conn = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="notify-dispatcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                while self.dispatch_batch() == self.batch_size:
+                    pass
+            except psycopg2.Error as error:
+                logger.warning("Notification dispatch failed: %s", error)
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _send(self, row):
+        try:
+            return self.transport.send(row[1], row[2]), None
+        except Exception as error:
+            return None, str(error)
+
+    # Claim one batch of due messages, send them in parallel and record each outcome
+    # Bodies can hold credentials, e.g. a new user's password, so they are cleared once a message is done with
+    def dispatch_batch(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = psycopg2.connect(connection)
+        cur = self._conn.cursor()
+        cur.execute("select id, recipient, body, attempts from notification_outbox\n"
+                    "where status='pending' and next_attempt_at <= now()\n"
+                    "order by id limit %s for update skip locked;", (self.batch_size,))
+        rows = cur.fetchall()
+
+        for row, (status, error) in zip(rows, self._executor.map(self._send, rows)):
+            if error is None:
+                logger.debug("Notification %s %s", row[0], status)
+                cur.execute("update notification_outbox set status='sent', attempts=attempts+1, body=null\n"
+                            "where id=%s;", (row[0],))
+            else:
+                attempts = row[3] + 1
+                status = "failed" if attempts >= self.max_attempts else "pending"
+                delay = self.backoff * 2 ** (attempts - 1)
+                cur.execute("update notification_outbox set status=%s, attempts=%s, last_error=%s,\n"
+                            "body=case when %s='failed' then null else body end,\n"
+                            "next_attempt_at=now() + %s * interval '1 second' where id=%s;",
+                            (status, attempts, error, status, delay, row[0]))
+
+        self._conn.commit()
+        return len(rows)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+# Function to start the worker's dispatcher once, or return the running one
+def start_dispatcher(transport=None):
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = Dispatcher(transport or TRANSPORTS[NOTIFY_TRANSPORT]())
+            _dispatcher.start()
+    return _dispatcher
+
+
+# Function to let the dispatcher pick up freshly committed messages right away
+def wake():
+    start_dispatcher().wake()
+
+
+# Deliver everything that is pending and exit
+if __name__ == '__main__':
+    dispatcher = Dispatcher(TRANSPORTS[NOTIFY_TRANSPORT]())
+    while dispatcher.dispatch_batch() != 0:
+        pass
+    dispatcher.stop()
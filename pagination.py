@@ -0,0 +1,61 @@
+import os
+import json
+import base64
+from flask import request
+
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "500"))
+INT_RANGE = range(-2 ** 31, 2 ** 31)
+
+
+# Error raised for a malformed page size or cursor
+class InvalidPage(ValueError):
+    pass
+
+
+# Function to encode the sort key of the last row of a page as an opaque cursor
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+# Function to decode a cursor, checking it holds one value of each of the given types, as its endpoint's sort key
+# A tampered cursor is rejected here instead of failing as a query parameter
+def decode_cursor(cursor, types):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise InvalidPage("Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(types):
+        raise InvalidPage("Invalid cursor")
+    for value, value_type in zip(values, types):
+        if type(value) is not value_type or (value_type is int and value not in INT_RANGE):
+            raise InvalidPage("Invalid cursor")
+    return values
+
+
+# Function to read the page size and cursor of a listing request, no limit returns the whole listing
+# The cursor has to match the types of the listing's sort key
+def page_args(types):
+    limit = request.args.get("limit")
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise InvalidPage("Invalid limit")
+        if limit <= 0:
+            raise InvalidPage("Invalid limit")
+        limit = min(limit, PAGE_SIZE_MAX)
+    after = request.args.get("after")
+    return limit, None if after is None else decode_cursor(after, types)
+
+
+# Function to get the limit clause fetching one extra row to tell whether another page follows
+def limit_clause(limit):
+    return "" if limit is None else f" limit {limit + 1}"
+
+
+# Function to cut the extra row and build the cursor of the next page
+def page(rows, limit, key):
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key(rows[-1]))
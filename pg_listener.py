@@ -0,0 +1,169 @@
+import os
+import queue
+import logging
+import select
+import threading
+import psycopg2
+from db import connection
+from psycopg2 import sql
+
+LISTEN_RECONNECT = float(os.getenv("LISTEN_RECONNECT", "5"))
+FEED_QUEUE_SIZE = int(os.getenv("FEED_QUEUE_SIZE", "100"))
+
+logger = logging.getLogger(__name__)
+
+
+# Worker-wide LISTEN connection handing notifications to the callbacks subscribed to their channel
+class Listener:
+    def __init__(self, dsn=connection, reconnect=LISTEN_RECONNECT):
+        self.dsn = dsn
+        self.reconnect = reconnect
+        self._callbacks = {}
+        self._reconnect_callbacks = []
+        self._listening = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake_read, self._wake_write = os.pipe()
+        self._thread = None
+        self._conn = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="pg-listener", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        os.write(self._wake_write, b"\0")
+        if self._thread is not None:
+            self._thread.join()
+
+    def subscribe(self, channel, callback):
+        with self._lock:
+            self._callbacks.setdefault(channel, []).append(callback)
+        os.write(self._wake_write, b"\0")
+        self.start()
+
+    def unsubscribe(self, channel, callback):
+        with self._lock:
+            self._callbacks.get(channel, []).remove(callback)
+
+    # Callbacks run after every (re)connect, notifications sent while disconnected are lost
+    def on_reconnect(self, callback):
+        with self._lock:
+            self._reconnect_callbacks.append(callback)
+
+    def _connect(self):
+        self._conn = psycopg2.connect(self.dsn)
+        self._conn.autocommit = True
+        self._listening = set()
+        with self._lock:
+            callbacks = list(self._reconnect_callbacks)
+        for callback in callbacks:
+            self._call(callback)
+
+    def _listen(self):
+        with self._lock:
+            channels = set(self._callbacks) - self._listening
+        with self._conn.cursor() as cur:
+            for channel in channels:
+                cur.execute(sql.SQL("listen {};").format(sql.Identifier(channel)))
+        self._listening |= channels
+
+    def _dispatch(self):
+        self._conn.poll()
+        while self._conn.notifies:
+            notify = self._conn.notifies.pop(0)
+            with self._lock:
+                callbacks = list(self._callbacks.get(notify.channel, []))
+            for callback in callbacks:
+                self._call(callback, notify.channel, notify.payload)
+
+    @staticmethod
+    def _call(callback, *args):
+        try:
+            callback(*args)
+        except Exception:
+            logger.exception("Listener callback failed")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._conn is None or self._conn.closed:
+                    self._connect()
+                self._listen()
+                readable, _, _ = select.select([self._conn, self._wake_read], [], [])
+                if self._wake_read in readable:
+                    os.read(self._wake_read, 1024)
+                if self._conn in readable:
+                    self._dispatch()
+            except (psycopg2.Error, OSError) as error:
+                logger.warning("Listener connection failed, reconnecting in %ss: %s", self.reconnect, error)
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+                self._stop.wait(self.reconnect)
+        if self._conn is not None:
+            self._conn.close()
+
+
+# Error raised when a feed already has as many subscribers as it may serve
+class FeedFull(Exception):
+    pass
+
+
+# Fan-out of one channel's notifications to local subscribers, e.g. connected event streams, up to max_subscribers
+# A subscriber that falls FEED_QUEUE_SIZE messages behind is dropped and receives None
+class Feed:
+    def __init__(self, channel, maxsize=FEED_QUEUE_SIZE, max_subscribers=None):
+        self.channel = channel
+        self.maxsize = maxsize
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._subscribed = False
+
+    def subscribe(self):
+        events = queue.Queue(self.maxsize)
+        with self._lock:
+            if self.max_subscribers is not None and len(self._subscribers) >= self.max_subscribers:
+                raise FeedFull(f"{self.channel} feed is full")
+            self._subscribers.add(events)
+            subscribe = not self._subscribed
+            self._subscribed = True
+        if subscribe:
+            get_listener().subscribe(self.channel, self.publish)
+        return events
+
+    def unsubscribe(self, events):
+        with self._lock:
+            self._subscribers.discard(events)
+
+    def publish(self, channel, payload):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for events in subscribers:
+            try:
+                events.put_nowait(payload)
+            except queue.Full:
+                self.unsubscribe(events)
+                with events.mutex:
+                    events.queue.clear()
+                events.put_nowait(None)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+# Function to get the worker's listener, created on first use
+def get_listener():
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            _listener = Listener()
+    return _listener
@@ -1,27 +1,48 @@
 import os
 import jwt
+import hmac
+import hashlib
+import metrics
+import encoding
 import psycopg2
-import pandas as pd
+import cache_bus
+import notifications
+from ledger import refresh_ledger
+from shares import resolve_shares
+from settlement import settlement
 from flask_cors import CORS
 from functools import wraps
 from dotenv import load_dotenv
-from twilio.rest import Client
-from flask import Flask, request
+from flask import Flask, request, g
 from random import choice, shuffle
+from bill_import import import_bills
+from bill_snapshot import get_snapshot
+from pg_listener import Feed, FeedFull
+from psycopg2.extras import execute_values
+from cache import TTLCache, cached, response_cache
+from db import get_conn, release_conn, fetch_records
+from pagination import InvalidPage, page_args, limit_clause, page
+from bill_status import STATUS_CHANNEL, lock_bills, refresh_bill_status, settle_bill
+from streaming import SSE_MAX_CLIENTS, iter_query, stream_response, wants_stream, event_response
 from werkzeug.security import generate_password_hash, check_password_hash
 
 load_dotenv()
 
-connection = f"dbname=bill_splitter_db user={os.getenv('DB_USER')} password={os.getenv('DB_PASSWORD')}"
-
 app = Flask(__name__)
+app.json = encoding.FastJSONProvider(app)
 CORS(app)
+app.teardown_appcontext(release_conn)
+app.config["QUERY_COUNT_HEADER"] = os.getenv("QUERY_COUNT_HEADER", "0") == "1"
+metrics.init_app(app)
 
-account_sid = os.getenv('ACCT_SID')
-auth_token = os.getenv('TWILIO_AUTH')
-TWILIO_PHONE = os.getenv('TWILIO_PHONE')
 MY_PHONE = os.getenv('PERSONAL_PHONE')
 
+BATCH_MAX = int(os.getenv("BATCH_MAX", "20"))
+
+status_feed = Feed(STATUS_CHANNEL, max_subscribers=SSE_MAX_CLIENTS)
+
+login_cache = TTLCache(int(os.getenv("LOGIN_CACHE_SIZE", "0")), float(os.getenv("LOGIN_CACHE_TTL", "300")))
+
 
 # Function to return error object
 def auth_error(error):
@@ -30,6 +51,18 @@ def auth_error(error):
     }
 
 
+# Function to check a token against the user it was given to, returning the error or None
+def verify_token(access_token, username):
+    try:
+        token = jwt.decode(access_token, "secret", algorithms=["HS256"])
+    except (jwt.InvalidTokenError, jwt.DecodeError):
+        return "Invalid token"
+
+    if token["username"] != username:
+        return "Invalid user token"
+    return None
+
+
 # Function for token authentication
 def token_check(f):
     @wraps(f)
@@ -37,53 +70,91 @@ def token_check(f):
         if 'x-access-token' not in request.headers or "x-access-user" not in request.headers:
             return auth_error("Missing headers")
 
-        try:
-            token = jwt.decode(request.headers["x-access-token"], "secret", algorithms=["HS256"])
-        except (jwt.InvalidTokenError, jwt.DecodeError):
-            return auth_error("Invalid token")
-
-        if token["username"] != request.headers["x-access-user"]:
-            return auth_error("Invalid user token")
+        error = verify_token(request.headers["x-access-token"], request.headers["x-access-user"])
+        if error is not None:
+            return auth_error(error)
 
         return f()
 
     return decorated_function
 
 
-# Function for get user item/bill data
-def get_data(input_cols, table_name, format_cols, output_cols, condition=""):
-    conn = psycopg2.connect(connection)
-    cur = conn.cursor()
-    table = "user_items ui inner join items i on ui.item_id=i.item_id" if table_name == "user_items" else table_name
-    cur.execute(f"select {input_cols} from {table} {condition};")
-    df = pd.DataFrame(cur.fetchall(), columns=output_cols)
-    for col in format_cols:
-        df[col] = df[col].astype("float")
+# Reply to a malformed page size or cursor
+@app.errorhandler(InvalidPage)
+def invalid_page(error):
+    return auth_error(str(error)), 400
 
-    conn.commit()
-    conn.close()
-    return df.to_dict("records")
 
+# Reply to an event stream request when the worker already serves as many streams as it has room for
+@app.errorhandler(FeedFull)
+def feed_full(error):
+    return auth_error("Too many event streams"), 503, {"Retry-After": "30"}
 
-# Function for ids for items
-def get_item_ids(bill):
-    conn = psycopg2.connect(connection)
-    cur = conn.cursor()
-    cur.execute(f"select item_id, item_name from items where bill_name='{bill}';")
-    ids = {name: item_id for item_id, name in cur.fetchall()}
 
+# Function to fill the where clause of a listing query with the conditions of the given filters
+def filtered_query(query, conditions, filters):
+    where = "" if len(filters) == 0 else "where " + " and ".join(conditions[name] for name in filters) + "\n"
+    return query.format(where=where)
+
+
+# Function to commit a write and evict the cache tags it changed, in this worker now and in the others through the bus
+def commit_changes(conn, *tags):
+    cache_bus.publish(conn.cursor(), *tags)
     conn.commit()
-    conn.close()
-    return ids, ", ".join([str(id_) for id_ in ids.values()])
+    response_cache.invalidate(*tags)
+
+
+BILL_USER_ITEMS_QUERY = ("select i.item_id, i.item_name, ui.username, ui.amount, ui.share\n"
+                         "from items i left join user_items ui\n"
+                         "on ui.item_id=i.item_id and ui.username = any(%(usernames)s)\n"
+                         "where i.bill_name=%(bill)s;")
+
+
+# Function to write users' items for a bill as a diff against the stored rows
+def sync_user_items(cur, bill, user_items):
+    cur.execute(BILL_USER_ITEMS_QUERY, {"usernames": list(user_items), "bill": bill})
+    item_ids = {}
+    current = {}
+    for item_id, item_name, username, amount, share in cur.fetchall():
+        item_ids[item_name] = item_id
+        if username is not None:
+            current[(username, item_id)] = (float(amount), float(share))
+
+    wanted = {(username, item_ids[item["name"]]): (float(item["cost"]), float(item["share"]))
+              for username, items in user_items.items() for item in items}
+    upserts = [(username, item_id, amount, share) for (username, item_id), (amount, share) in wanted.items()
+               if current.get((username, item_id)) != (amount, share)]
+    deletes = [key for key in current if key not in wanted]
+
+    if len(upserts) != 0:
+        execute_values(cur, "insert into user_items (username, item_id, amount, share) values %s\n"
+                            "on conflict (username, item_id)\n"
+                            "do update set amount=excluded.amount, share=excluded.share;", upserts,
+                       page_size=len(upserts))
+    if len(deletes) != 0:
+        cur.execute("delete from user_items where (username, item_id) in\n"
+                    "(select * from unnest(%s::text[], %s::int[]));",
+                    ([username for username, _ in deletes], [item_id for _, item_id in deletes]))
+
+    updated = sum(1 for username, item_id, _, _ in upserts if (username, item_id) in current)
+    return {
+        "inserted": len(upserts) - updated,
+        "updated": updated,
+        "deleted": len(deletes)
+    }
 
 
-# Function to get item entry strings
-def get_item_entries(username, items, item_ids):
-    item_entries = []
-    for item in items:
-        item_id, amount, share = item_ids[item["name"]], item["cost"], item["share"]
-        item_entries.append(f"('{username}', {str(item_id)}, {str(amount)}, {str(share)})")
-    return ", ".join(item_entries)
+# Function to check a password, skipping the hash check for recently verified logins
+def verify_password(username, password_hash, password):
+    digest = hashlib.sha256(f"{password_hash}:{password}".encode()).hexdigest()
+    if hmac.compare_digest(login_cache.get(username, ""), digest):
+        return True
+
+    if not check_password_hash(password_hash, password):
+        return False
+
+    login_cache.set(username, digest)
+    return True
 
 
 # Function to generate a password
@@ -103,6 +174,14 @@ def password_generator():
     return "".join(password_list)
 
 
+# Report the number of queries a request ran, used by the benchmark driver
+@app.after_request
+def query_count_header(response):
+    if app.config["QUERY_COUNT_HEADER"]:
+        response.headers["X-Query-Count"] = str(g.get("query_count", 0))
+    return response
+
+
 # Server test ping
 @app.route('/api/ping', methods=["GET"])
 def server_ping():
@@ -111,36 +190,32 @@ def server_ping():
     }
 
 
+LOGIN_QUERY = "select password, first_name, last_name, user_group from users where username=%(username)s;"
+
+
 # Check if username and password exist
 @app.route('/api/login', methods=["GET"])
 def login_check():
-    conn = psycopg2.connect(connection)
+    conn = get_conn()
     cur = conn.cursor()
-    cur.execute(f"select username, password from users;")
-    users_dict = {username: password for username, password in cur.fetchall()}
-
     username = request.args.get("username")
     password = request.args.get("password")
-    if username not in users_dict:
-        conn.commit()
-        conn.close()
+    cur.execute(LOGIN_QUERY, {"username": username})
+    user = cur.fetchone()
+    conn.commit()
+    if user is None:
         return {
             "success": False,
             "error": "Username"
         }
 
-    if not check_password_hash(users_dict[username], password):
-        conn.commit()
-        conn.close()
+    password_hash, user_first_name, user_last_name, user_group = user
+    if not verify_password(username, password_hash, password):
         return {
             "success": False,
             "error": "Password"
         }
 
-    cur.execute(f"select first_name, last_name, user_group from users where username='{username}';")
-    user_first_name, user_last_name, user_group = cur.fetchone()
-    conn.commit()
-    conn.close()
     return {
         "success": True,
         "token": jwt.encode({"username": username}, "secret", algorithm="HS256"),
@@ -153,45 +228,50 @@ def login_check():
 @app.route('/api/password', methods=["POST"])
 @token_check
 def change_password():
-    conn = psycopg2.connect(connection)
+    conn = get_conn()
     cur = conn.cursor()
     username = request.json["username"]
     password = generate_password_hash(request.json["password"], "sha256")
     cur.execute(f"update users set password='{password}' where username='{username}';")
 
     conn.commit()
-    conn.close()
+    login_cache.pop(username)
     return {
         "success": True
     }
 
 
+USER_QUERY = "select first_name, last_name from users where username=%(username)s;"
+
+
 # Get User data
 @app.route('/api/user', methods=["GET"])
 @token_check
 def user_data():
-    conn = psycopg2.connect(connection)
+    conn = get_conn()
     cur = conn.cursor()
     username = request.args.get("username")
-    cur.execute(f"select first_name, last_name from users where username='{username}';")
+    cur.execute(USER_QUERY, {"username": username})
     user_name = {key: value for key, value in zip(["firstName", "lastName"], cur.fetchone())}
     conn.commit()
-    conn.close()
     return user_name
 
 
+BILLS_QUERY = "select bill_name from bills where bill_group=%(group)s;"
+ADMIN_BILLS_QUERY = "select bill_name from bills;"
+
+
 # Get list of all unsettled bills
 @app.route('/api/bills', methods=["GET"])
 @token_check
+@cached("bills")
 def get_bills():
-    conn = psycopg2.connect(connection)
+    conn = get_conn()
     cur = conn.cursor()
     user_group = request.args.get("userGroup")
-    condition = "" if user_group == "admin" else f" where bill_group='{user_group}'"
-    cur.execute(f"select bill_name from bills{condition};")
+    cur.execute(ADMIN_BILLS_QUERY if user_group == "admin" else BILLS_QUERY, {"group": user_group})
     bills = [bill[0] for bill in cur.fetchall()]
     conn.commit()
-    conn.close()
     return {
         "bills": bills
     }
@@ -200,37 +280,64 @@ def get_bills():
 # Get bill data
 @app.route('/api/bill', methods=["GET"])
 @token_check
+@cached("bill:{bill}")
 def get_bill():
-    bill = request.args.get("bill").replace("'", "''")
-    items = get_data("item_name, quantity, type", "items", [],
-                     ["name", "quantity", "type"], f" where bill_name='{bill}'")
-    for item in items:
-        item["cost"] = 0
-        item["share"] = 0
+    conn = get_conn()
+    snapshot = get_snapshot(conn.cursor(), request.args.get("bill"))
+    conn.commit()
+    items = () if snapshot is None else snapshot.items
+
+    return {"items": [{"name": item.name, "quantity": item.quantity, "type": item.type, "cost": 0, "share": 0}
+                      for item in items]}
 
-    return {"items": items}
+
+USER_BILLS_QUERY = "select bill_name, amount, paid, locked from user_bills\n{where}order by bill_name"
+USER_BILLS_FILTERS = {
+    "username": "username=%(username)s",
+    "paid": "paid=%(paid)s",
+    "after": "bill_name > %(after)s"
+}
 
 
 # Get bills for the user
 @app.route('/api/user-bills', methods=["GET"])
 @token_check
 def get_user_bills():
-    username = request.args.get("username")
-    return {"bills": get_data("bill_name, amount, paid, locked", "user_bills", ["amount"],
-                              ["name", "amount", "paid", "locked"], f"where username='{username}'")}
+    limit, after = page_args((str,))
+    conn = get_conn()
+    cur = conn.cursor()
+    filters = ["username"] + (["paid"] if "paid" in request.args else []) + ([] if after is None else ["after"])
+    query = filtered_query(USER_BILLS_QUERY, USER_BILLS_FILTERS, filters)
+    cur.execute(f"{query}{limit_clause(limit)};", {
+                    "username": request.args.get("username"),
+                    "paid": request.args.get("paid") == "true",
+                    "after": after[0] if after else None
+                })
+    bills, next_page = page(fetch_records(cur, ["name", "amount", "paid", "locked"]), limit,
+                            lambda bill: [bill["name"]])
+    conn.commit()
+    return {
+        "bills": bills,
+        "next": next_page
+    }
+
+
+USER_BILL_QUERY = ("select item_name, amount, quantity, share, type\n"
+                   "from user_items ui inner join items i on ui.item_id=i.item_id\n"
+                   "where bill_name=%(bill)s and username=%(username)s;")
 
 
 # Get a bill for the user
 @app.route('/api/user-bill', methods=["GET"])
 @token_check
 def get_user_bill():
-    username = request.args.get("username")
-    bill = request.args.get("bill").replace("'", "''")
-
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(USER_BILL_QUERY, {"bill": request.args.get("bill"), "username": request.args.get("username")})
+    items = fetch_records(cur, ["name", "cost", "quantity", "share", "type"])
+    conn.commit()
     return {
-        "items": get_data("item_name, amount, quantity, share, type", "user_items", ["cost", "share"],
-                          ["name", "cost", "quantity", "share", "type"],
-                          f"where bill_name='{bill}' and username='{username}'")
+        "items": items
     }
 
 
@@ -238,33 +345,39 @@ def get_user_bill():
 @app.route('/api/add-user-bills', methods=["POST"])
 @token_check
 def add_user_bills():
-    conn = psycopg2.connect(connection)
+    conn = get_conn()
     cur = conn.cursor()
     username = request.json["username"]
+    lock_bills(cur, request.json["bills"])
     user_bills = [bill.replace("'", "''") for bill in request.json["bills"]]
     entries = ", ".join([f"('{username}', '{bill}', 0, false, false)" for bill in user_bills])
     cur.execute(f"insert into user_bills (username, bill_name, amount, paid, locked) values {entries};")
+    refresh_bill_status(cur, request.json["bills"])
 
-    conn.commit()
-    conn.close()
+    commit_changes(conn, *[f"bill:{bill}" for bill in request.json["bills"]])
     return {}
 
 
+REMOVE_USER_BILLS_QUERY = "delete from user_bills where username=%(username)s and bill_name = any(%(bills)s);"
+REMOVE_USER_ITEMS_QUERY = ("delete from user_items ui using items i\n"
+                           "where ui.item_id=i.item_id and ui.username=%(username)s and i.bill_name = any(%(bills)s);")
+
+
 # Remove a bill from user bills
 @app.route('/api/remove-user-bills', methods=["POST"])
 @token_check
 def remove_user_bills():
-    conn = psycopg2.connect(connection)
+    conn = get_conn()
     cur = conn.cursor()
     username = request.json["username"]
     bills = request.json["bills"]
-    entries = ", ".join(["'" + bill.replace("'", "''") + "'" for bill in bills])
-    cur.execute(f"delete from user_bills where username='{username}' and bill_name in ({entries});")
-    id_query = ", ".join([get_item_ids(bill.replace("'", "''"))[1] for bill in bills])
-    cur.execute(f"delete from user_items where username='{username}' and item_id in ({id_query});")
+    lock_bills(cur, bills)
+    cur.execute(REMOVE_USER_BILLS_QUERY, {"username": username, "bills": bills})
+    cur.execute(REMOVE_USER_ITEMS_QUERY, {"username": username, "bills": bills})
+    refresh_bill_status(cur, bills)
+    refresh_ledger(cur, [username])
 
-    conn.commit()
-    conn.close()
+    commit_changes(conn, *[f"bill:{bill}" for bill in bills])
     return {}
 
 
@@ -272,32 +385,29 @@ def remove_user_bills():
 @app.route('/api/update-user-bill', methods=["POST"])
 @token_check
 def update_user_bill():
-    conn = psycopg2.connect(connection)
+    conn = get_conn()
     cur = conn.cursor()
     username = request.json["username"]
-    bill = request.json["bill"].replace("'", "''")
     items = request.json["items"]
-    item_ids, id_query = get_item_ids(bill)
-    entries = get_item_entries(username, items, item_ids)
-    cur.execute(f"delete from user_items where username='{username}' and item_id in ({id_query});")
-    cur.execute(f"insert into user_items (username, item_id, amount, share) values {entries};")
+    lock_bills(cur, [request.json["bill"]])
+    changes = sync_user_items(cur, request.json["bill"], {username: items})
 
-    conn.commit()
-    conn.close()
-    return {}
+    commit_changes(conn, f"bill:{request.json['bill']}")
+    return changes
 
 
 # Lock a user bill
 @app.route('/api/lock-user-bill', methods=["POST"])
 @token_check
 def lock_user_bill():
-    conn = psycopg2.connect(connection)
+    conn = get_conn()
     cur = conn.cursor()
     username = request.json["username"]
     bill_name = request.json["bill"].replace("'", "''")
+    lock_bills(cur, [request.json["bill"]])
     cur.execute(f"update user_bills set locked=true where username='{username}' and bill_name='{bill_name}';")
+    refresh_bill_status(cur, [request.json["bill"]])
     conn.commit()
-    conn.close()
     return {}
 
 
@@ -305,47 +415,72 @@ def lock_user_bill():
 @app.route('/api/unlock-bill', methods=["POST"])
 @token_check
 def unlock_bill():
-    conn = psycopg2.connect(connection)
+    conn = get_conn()
     cur = conn.cursor()
     usernames = ", ".join([f"'{user}'" for user in request.json["users"]])
     bill_name = request.json["bill"].replace("'", "''")
+    lock_bills(cur, [request.json["bill"]])
     cur.execute(f"update user_bills set locked=false where bill_name='{bill_name}' and username in ({usernames});")
+    refresh_bill_status(cur, [request.json["bill"]])
     conn.commit()
-    conn.close()
     return {}
 
 
-# Get all bills and update their statuses
+# Push bill status transitions as server-sent events
+# EventSource cannot send headers, so the token and user come as query arguments
+@app.route('/api/bill-events', methods=["GET"])
+def bill_events():
+    if "token" not in request.args or "user" not in request.args:
+        return auth_error("Missing token")
+
+    error = verify_token(request.args["token"], request.args["user"])
+    if error is not None:
+        return auth_error(error)
+
+    return event_response(status_feed, "status")
+
+
+# Function to format a bill of the all bills listing
+def bill_entry(bill_name, status, members, _=None):
+    bill = {"name": bill_name, "status": status}
+    if members != 0:
+        bill["members"] = members
+    return bill
+
+
+ALL_BILLS_QUERY = ("select bill_name, status, members, bill_status_rank(status) from bills\n"
+                   "{where}order by bill_status_rank(status), bill_name")
+ALL_BILLS_FILTERS = {
+    "status": "bill_status_rank(status)=bill_status_rank(%(status)s) and status=%(status)s",
+    "group": "bill_group=%(group)s",
+    "after": "(bill_status_rank(status), bill_name) > (%(rank)s, %(name)s)"
+}
+
+
+# Get all bills with their stored statuses
 @app.route('/api/all-bills', methods=["GET"])
 @token_check
 def get_all_bills():
-    conn = psycopg2.connect(connection)
+    limit, after = page_args((int, str))
+    conn = get_conn()
     cur = conn.cursor()
-    update_bills = []
-    cur.execute("select bill_name, bool_and(locked), count(locked) from user_bills group by bill_name;")
-    bills_data = {bill_name: (all_locked, user_count) for bill_name, all_locked, user_count in cur.fetchall()}
-    all_bills = get_data("bill_name, status", "bills", [], ["name", "status"])
-    for bill in all_bills:
-        status = "open"
-        if bill["name"] in bills_data:
-            all_locked, user_count = bills_data[bill["name"]]
-            status = "ready" if all_locked else "pending"
-            bill["members"] = user_count
-        if bill["status"] != "settled" and bill["status"] != status:
-            bill["status"] = status
-            update_bills.append((bill["name"].replace("'", "''"), status))
-
-    if len(update_bills) != 0:
-        entries = ", ".join([f"('{entry[0]}', '{entry[1]}')" for entry in update_bills])
-        cur.execute(f"update bills as b set status=b2.status from (values {entries}) as b2(bill_name, status)\n"
-                    f"where b.bill_name = b2.bill_name;")
-
-    order = {"ready": 0, "pending": 1, "open": 2, "settled": 3}
+    filters = [name for name in ("status", "group") if name in request.args] + ([] if after is None else ["after"])
+    query = filtered_query(ALL_BILLS_QUERY, ALL_BILLS_FILTERS, filters)
+    params = {
+        "status": request.args.get("status"),
+        "group": request.args.get("group"),
+        "rank": after[0] if after else None,
+        "name": after[-1] if after else None
+    }
+    if wants_stream(request.args):
+        return stream_response("bills", (bill_entry(*row) for row in iter_query(conn, query, params)))
 
+    cur.execute(f"{query}{limit_clause(limit)};", params)
+    rows, next_page = page(cur.fetchall(), limit, lambda row: [row[3], row[0]])
     conn.commit()
-    conn.close()
     return {
-        "bills": sorted(all_bills, key=lambda a: (order[a["status"]], a["name"]))
+        "bills": [bill_entry(*row) for row in rows],
+        "next": next_page
     }
 
 
@@ -353,75 +488,25 @@ def get_all_bills():
 @app.route('/api/manage-bill', methods=["GET"])
 @token_check
 def manage_bill():
-    conn = psycopg2.connect(connection)
-    cur = conn.cursor()
-    bill = request.args.get("bill").replace("'", "''")
-    cur.execute(f"select username from user_bills where bill_name='{bill}';")
-    bill_users = [bill_data[0] for bill_data in cur.fetchall()]
-
-    items_data: dict[str, list] = {}
-    cur.execute(f"select username, item_name, share\n"
-                f"from user_items ui inner join items i on ui.item_id=i.item_id\n"
-                f"where bill_name='{bill}';")
-    for item_user, item_name, user_share in cur.fetchall():
-        if item_name not in items_data:
-            items_data[item_name] = []
+    conn = get_conn()
+    snapshot = get_snapshot(conn.cursor(), request.args.get("bill"))
+    conn.commit()
+    if snapshot is None:
+        return auth_error("Unknown bill"), 404
+
+    user_shares = [(item.name, user_share) for item in snapshot.items for user_share in item.shares]
+    shares = resolve_shares([item_name for item_name, _ in user_shares], [share.share for _, share in user_shares])
+    items_data = {item.name: [] for item in snapshot.items}
+    for (item_name, user_share), share in zip(user_shares, shares):
         items_data[item_name].append({
-            "username": item_user,
-            "share": float(user_share)
+            "username": user_share.username,
+            "share": share
         })
 
-    for item in items_data:
-        sharing = {}
-        specified = {}
-        total_share = 0
-        item_users = items_data[item]
-
-        for user in item_users:
-            if user["share"] == 0:
-                sharing[user["username"]] = None
-            else:
-                specified[user["username"]] = None
-                total_share += user["share"]
-
-        if len(sharing) == 0:
-            if total_share != 1:
-                change = (1 - total_share) / len(specified)
-                for user in item_users:
-                    if user["username"] in specified:
-                        user["share"] = round(user["share"] + change, 2)
-        else:
-            if total_share < 1:
-                change = (1 - total_share) / len(sharing)
-                for user in item_users:
-                    if user["username"] in sharing:
-                        user["share"] = round(change, 2)
-            else:
-                if total_share > 1:
-                    change = (1 - total_share) / len(specified)
-                    for user in item_users:
-                        if user["username"] in specified:
-                            user["share"] += change
-                change = 1 / (len(specified) + len(sharing))
-
-                for user in item_users:
-                    if user["username"] in sharing:
-                        user["share"] = round(change, 2)
-                    else:
-                        user["share"] = round(user["share"] * change * len(specified), 2)
-
-    cur.execute(f"select item_name from items where bill_name='{bill}'")
-    for item in cur.fetchall():
-        if item[0] not in items_data:
-            items_data[item[0]] = []
-    cur.execute(f"select bill_group from bills where bill_name='{bill}'")
-    bill_group = cur.fetchone()[0]
-    conn.commit()
-    conn.close()
     return {
         "items": [{"name": key, "users": value} for key, value in items_data.items()],
-        "users": bill_users,
-        "group": bill_group
+        "users": list(snapshot.users),
+        "group": snapshot.group
     }
 
 
@@ -429,16 +514,16 @@ def manage_bill():
 @app.route('/api/save-bill', methods=["POST"])
 @token_check
 def save_bill():
-    conn = psycopg2.connect(connection)
+    conn = get_conn()
     cur = conn.cursor()
     bill = request.json["bill"].replace("'", "''")
     new_users = request.json["newUsers"]
     old_users = request.json["oldUsers"]
     items_data = request.json["items"]
 
-    bill_data = get_data("item_name, cost, quantity, type", "items", ["cost"],
-                         ["name", "cost", "quantity", "type"], f"where bill_name='{bill}'")
-    items = {item["name"]: item for item in bill_data}
+    lock_bills(cur, [request.json["bill"]])
+    snapshot = get_snapshot(cur, request.json["bill"])
+    items = {} if snapshot is None else {item.name: item for item in snapshot.items}
     user_items = {}
     for item in items_data:
         for user in item["users"]:
@@ -446,106 +531,226 @@ def save_bill():
                 user_items[user["username"]] = {"items": [], "amount": 0}
             user_items[user["username"]]["items"].append({
                 "name": item["name"],
-                "quantity": items[item["name"]]["quantity"],
-                "type": items[item["name"]]["type"],
+                "quantity": items[item["name"]].quantity,
+                "type": items[item["name"]].type,
                 "share": user["share"],
-                "cost": round(items[item["name"]]["cost"] * user["share"], 2)
+                "cost": round(float(items[item["name"]].cost) * user["share"], 2)
             })
 
-    existing_users = list(set(user_items) - set(new_users) - set(old_users))
-    item_ids, id_query = get_item_ids(bill)
-
     if len(new_users) != 0:
         entries = ", ".join([f"('{user}', '{bill}', 0, false, true)" for user in new_users])
         cur.execute(f"insert into user_bills (username, bill_name, amount, paid, locked) values {entries};")
 
-        entries = ", ".join([get_item_entries(user, user_items[user]["items"], item_ids) for user in new_users])
-        cur.execute(f"insert into user_items (username, item_id, amount, share) values {entries};")
-
     if len(old_users) != 0:
         entries = ", ".join(["'" + user + "'" for user in old_users])
         cur.execute(f"delete from user_bills where username in ({entries}) and bill_name='{bill}';")
-        cur.execute(f"delete from user_items where username in ({entries}) and item_id in ({id_query});")
 
-    entries = ", ".join(["'" + user + "'" for user in existing_users])
-    cur.execute(f"delete from user_items where username in ({entries}) and item_id in ({id_query});")
-    entries = ", ".join([get_item_entries(user, user_items[user]["items"], item_ids) for user in existing_users])
-    cur.execute(f"insert into user_items (username, item_id, amount, share) values {entries};")
+    bill_user_items = {user: user_items[user]["items"] for user in user_items if user not in old_users}
+    bill_user_items.update({user: [] for user in old_users})
+    changes = sync_user_items(cur, request.json["bill"], bill_user_items)
+    refresh_bill_status(cur, [request.json["bill"]])
+    refresh_ledger(cur, old_users)
 
-    conn.commit()
-    conn.close()
-    return {}
+    commit_changes(conn, f"bill:{request.json['bill']}")
+    return changes
+
+
+BILL_AMOUNTS_QUERY = ("select username, sum(amount)\n"
+                      "from user_items ui inner join items i on ui.item_id=i.item_id\n"
+                      "where bill_name=%(bill)s group by username;")
+SUBMIT_AMOUNTS_QUERY = ("update user_bills as ub set amount=ub2.amount\n"
+                        "from unnest(%(usernames)s::text[], %(amounts)s::numeric[]) as ub2(username, amount)\n"
+                        "where bill_name=%(bill)s and ub.username = ub2.username;")
 
 
 # Save bill and update amounts for users
 @app.route('/api/submit-bill', methods=["POST"])
 @token_check
 def submit_bill():
-    conn = psycopg2.connect(connection)
+    conn = get_conn()
     cur = conn.cursor()
-    bill = request.json["bill"].replace("'", "''")
-    user_amounts = {}
-    cur.execute(f"select username, amount\n"
-                f"from user_items ui inner join items i on ui.item_id=i.item_id\n"
-                f"where bill_name='{bill}';")
-    for item_user, user_amount in cur.fetchall():
-        if item_user not in user_amounts:
-            user_amounts[item_user] = 0
-        user_amounts[item_user] += float(user_amount)
-
-    cur.execute(f"update bills set status='settled' where bill_name='{bill}';")
-    entries = ", ".join([f"('{user}', {round(user_amounts[user], 2)})" for user in user_amounts])
-    cur.execute(f"update user_bills as ub set amount=ub2.amount from (values {entries}) as ub2(username, amount)\n"
-                f"where bill_name='{bill}' and ub.username = ub2.username;")
-    conn.commit()
-    conn.close()
+    bill = request.json["bill"]
+    lock_bills(cur, [bill])
+    cur.execute(BILL_AMOUNTS_QUERY, {"bill": bill})
+    user_amounts = dict(cur.fetchall())
+
+    settle_bill(cur, bill)
+    cur.execute(SUBMIT_AMOUNTS_QUERY, {
+        "usernames": list(user_amounts),
+        "amounts": [round(amount, 2) for amount in user_amounts.values()],
+        "bill": bill
+    })
+    refresh_ledger(cur, user_amounts)
+    commit_changes(conn, f"bill:{bill}")
     return {}
 
 
+USERS_QUERY = "select username from users where user_group='admin' or user_group=%(group)s;"
+
+
 # Return users for that userGroup
 @app.route('/api/users', methods=["GET"])
 @token_check
+@cached("users")
 def get_users():
-    conn = psycopg2.connect(connection)
+    conn = get_conn()
     cur = conn.cursor()
     group = request.args["group"]
-    cur.execute(f"select username from users where user_group='admin' or user_group='{group}';")
+    cur.execute(USERS_QUERY, {"group": group})
     users = [q[0] for q in cur.fetchall()]
     conn.commit()
-    conn.close()
     return {
         "users": users
     }
 
 
+BILL_SPLIT_QUERY = "select username, amount, paid from user_bills where bill_name=%(bill)s;"
+
+
 # Return users and their shares for that bill
 @app.route('/api/bill-split', methods=["GET"])
 @token_check
+@cached("bill:{bill}")
 def bill_split():
-    bill = request.args["bill"].replace("'", "''")
+    conn = get_conn()
+    params = {"bill": request.args["bill"]}
+    if wants_stream(request.args):
+        rows = iter_query(conn, BILL_SPLIT_QUERY, params)
+        return stream_response("users", ({"name": name, "share": share, "paid": paid} for name, share, paid in rows))
+
+    cur = conn.cursor()
+    cur.execute(BILL_SPLIT_QUERY, params)
+    users = fetch_records(cur, ["name", "share", "paid"])
+    conn.commit()
     return {
-        "users": get_data("username, amount, paid", "user_bills", ["share"],
-                          ["name", "share", "paid"], f"where bill_name='{bill}'")
+        "users": users
+    }
+
+
+# Function to format a user of the all users listing from its ledger row
+def user_entry(username, outstanding, bills):
+    return {
+        "username": username,
+        "outstanding": outstanding,
+        "bills": bills
     }
 
 
-# Return all users and their respective debts
+ALL_USERS_QUERY = ("select u.username, coalesce(l.outstanding, 0), coalesce(l.bills, '[]')\n"
+                   "from users u left join user_ledger l on l.username=u.username\n"
+                   "{where}order by u.username")
+ALL_USERS_FILTERS = {
+    "group": "u.user_group=%(group)s",
+    "after": "u.username > %(after)s"
+}
+
+
+# Return all users and their respective debts from the ledger
 @app.route('/api/all-users', methods=["GET"])
 @token_check
 def all_users():
-    conn = psycopg2.connect(connection)
+    limit, after = page_args((str,))
+    conn = get_conn()
     cur = conn.cursor()
-    cur.execute("select username from users;")
-    user_bills_each = {user[0]: [] for user in cur.fetchall()}
-    user_bills_all = get_data("username, bill_name, amount, paid", "user_bills", ["amount"],
-                              ["username", "name", "amount", "paid"], "where amount!=0 and paid=false")
-    for entry in user_bills_all:
-        user_bills_each[entry["username"]].append({key: entry[key] for key in entry if key != "username"})
+    filters = (["group"] if "group" in request.args else []) + ([] if after is None else ["after"])
+    query = filtered_query(ALL_USERS_QUERY, ALL_USERS_FILTERS, filters)
+    params = {
+        "group": request.args.get("group"),
+        "after": after[0] if after else None
+    }
+    if wants_stream(request.args):
+        return stream_response("users", (user_entry(*row) for row in iter_query(conn, query, params)))
 
+    cur.execute(f"{query}{limit_clause(limit)};", params)
+    rows, next_page = page(cur.fetchall(), limit, lambda row: [row[0]])
     conn.commit()
-    conn.close()
     return {
-        "users": [{'username': key, 'bills': value} for key, value in user_bills_each.items()]
+        "users": [user_entry(*row) for row in rows],
+        "next": next_page
+    }
+
+
+# Read routes that can be combined in a batch
+BATCH_ENDPOINTS = {"user_data", "get_bills", "get_bill", "get_user_bills", "get_user_bill", "get_all_bills",
+                   "manage_bill", "get_users", "bill_split", "all_users", "get_settlement"}
+
+
+# Function to undo a failed sub-request, so the sub-requests after it still get a usable transaction
+def rollback_sub_request(conn):
+    try:
+        conn.cursor().execute("rollback to savepoint batch_request;")
+    except psycopg2.Error:
+        # The sub-request committed before it failed, which released the savepoint
+        conn.rollback()
+
+
+# Function to run a read route of a batch on the batch's connection, skipping its token check
+# A failing sub-request gets its own error status instead of failing the batch
+def run_sub_request(path, args):
+    args = {key: value for key, value in args.items() if key != "stream"}
+    with app.test_request_context(path, query_string=args):
+        if request.routing_exception is not None or request.url_rule.endpoint not in BATCH_ENDPOINTS:
+            return {"status": 404, "body": auth_error("Unknown route")}
+        conn = get_conn()
+        conn.cursor().execute("savepoint batch_request;")
+        try:
+            response = app.make_response(app.view_functions[request.url_rule.endpoint].__wrapped__())
+        except Exception as error:
+            rollback_sub_request(conn)
+            try:
+                response = app.make_response(app.handle_user_exception(error))
+            except Exception:
+                app.logger.exception("Batch request to %s failed", path)
+                return {"status": 500, "body": auth_error("Internal server error")}
+        return {
+            "status": response.status_code,
+            "body": response.get_json() if response.is_json else auth_error(response.status)
+        }
+
+
+# Run several read routes with one token check and one connection
+@app.route('/api/batch', methods=["POST"])
+@token_check
+def batch():
+    sub_requests = request.json["requests"]
+    if len(sub_requests) > BATCH_MAX:
+        return auth_error("Too many requests"), 400
+
+    # Sub-requests share the request's connection, so they run one after the other
+    return {
+        "responses": [run_sub_request(sub_request["path"], sub_request.get("args", {})) for sub_request in sub_requests]
+    }
+
+
+# Return the fewest transfers settling the unpaid bills of a group, or of everyone
+@app.route('/api/settlement', methods=["GET"])
+@token_check
+def get_settlement():
+    conn = get_conn()
+    transfers = settlement(conn.cursor(), request.args.get("group"))
+    conn.commit()
+    return {
+        "transfers": transfers
+    }
+
+
+# Request histograms of all workers in the Prometheus text format
+@app.route('/api/metrics', methods=["GET"])
+def metrics_export():
+    return metrics.registry.render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+
+# Return hit and miss counters of the worker's caches
+@app.route('/api/cache-stats', methods=["GET"])
+@token_check
+def cache_stats():
+    return {
+        "responses": response_cache.stats(),
+        "logins": {
+            "hits": login_cache.hits,
+            "misses": login_cache.misses,
+            "size": len(login_cache)
+        }
     }
 
 
@@ -553,7 +758,7 @@ def all_users():
 @app.route('/api/create-user', methods=["POST"])
 @token_check
 def create_user():
-    conn = psycopg2.connect(connection)
+    conn = get_conn()
     cur = conn.cursor()
     first_name = request.json["firstName"]
     last_name = request.json["lastName"]
@@ -564,18 +769,12 @@ def create_user():
 
     cur.execute(f"insert into users (username, first_name, last_name, password, user_group) values"
                 f" ('{username}', '{first_name}', '{last_name}', '{final_pass}', '{user_group}');")
+    refresh_ledger(cur, [username])
 
-    client = Client(account_sid, auth_token)
+    notifications.enqueue(cur, MY_PHONE, f"New user created:\n{username} @ {password} # {user_group}")
 
-    message = client.messages.create(
-        from_=f"whatsapp:{TWILIO_PHONE}",
-        body=f"New user created:\n{username} @ {password} # {user_group}",
-        to=f"whatsapp:{MY_PHONE}"
-    )
-    print(message.status)
-
-    conn.commit()
-    conn.close()
+    commit_changes(conn, "users")
+    notifications.wake()
     return {}
 
 
@@ -583,7 +782,7 @@ def create_user():
 @app.route('/api/create-bill', methods=["POST"])
 @token_check
 def create_bill():
-    conn = psycopg2.connect(connection)
+    conn = get_conn()
     cur = conn.cursor()
     bill = request.json["bill"]
     bill_group = request.json["billGroup"]
@@ -599,13 +798,32 @@ def create_bill():
     entries = ", ".join([f"('{bill}', '{item}', {cost}, {quantity}, '{item_type}')"
                          for item, cost, quantity, item_type in items_entries])
     cur.execute(f"insert into items (bill_name, item_name, cost, quantity, type) values {entries};")
-    cur.execute(f"insert into bills (bill_name, bill_group, status) values"
-                f" ('{bill}', '{bill_group}', 'open');")
+    cur.execute("insert into bills (bill_name, bill_group, status, paid_by) values (%s, %s, 'open', %s);",
+                (bill, bill_group, request.json.get("paidBy")))
+    refresh_bill_status(cur, [bill])
 
-    conn.commit()
-    conn.close()
+    commit_changes(conn, "bills", f"bill:{bill}")
     return {}
 
 
+# Create many bills at once, reporting which of them could not be created
+@app.route('/api/import-bills', methods=["POST"])
+@token_check
+def import_bills_route():
+    conn = get_conn()
+    cur = conn.cursor()
+    results = import_bills(cur, request.json["bills"])
+    created = [result["bill"] for result in results if result["success"]]
+
+    tags = ["bills"] + [f"bill:{bill}" for bill in created] if len(created) != 0 else []
+    commit_changes(conn, *tags)
+    return {
+        "results": results,
+        "created": len(created)
+    }
+
+
 if __name__ == '__main__':
+    notifications.start_dispatcher()
+    cache_bus.start_bus()
     app.run(host="0.0.0.0", debug=True, port=3000)
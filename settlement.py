@@ -0,0 +1,68 @@
+import sys
+import heapq
+import psycopg2
+from db import connection
+
+# Unpaid amounts per (debtor, payer) of everyone, or of one group
+DEBTS_SELECT = ("select ub.username, coalesce(b.paid_by, a.username), sum(ub.amount)\n"
+                "from user_bills ub inner join bills b on b.bill_name=ub.bill_name\n"
+                "cross join (select min(username) as username from users where user_group='admin') a\n"
+                "where ub.amount!=0 and ub.paid=false")
+DEBTS_QUERY = f"{DEBTS_SELECT}\ngroup by 1, 2;"
+GROUP_DEBTS_QUERY = f"{DEBTS_SELECT} and b.bill_group=%(group)s\ngroup by 1, 2;"
+
+
+# Function to sum unpaid amounts per (debtor, payer), bills without a payer were paid by the admin
+def fetch_debts(cur, group=None):
+    cur.execute(DEBTS_QUERY if group is None else GROUP_DEBTS_QUERY, {"group": group})
+    return cur.fetchall()
+
+
+# Function to net debts into one balance in cents per user, positive when the user is owed money
+def net_balances(debts):
+    balances = {}
+    for debtor, payer, amount in debts:
+        if payer is None or debtor == payer:
+            continue
+        cents = round(amount * 100)
+        balances[debtor] = balances.get(debtor, 0) - cents
+        balances[payer] = balances.get(payer, 0) + cents
+    return balances
+
+
+# Function to settle balances with at most one transfer less than the users involved
+# The largest debtor always pays the largest creditor, so each transfer clears at least one of them
+def settle(balances):
+    creditors = [(-cents, user) for user, cents in balances.items() if cents > 0]
+    debtors = [(cents, user) for user, cents in balances.items() if cents < 0]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    transfers = []
+    while creditors and debtors:
+        credit, creditor = heapq.heappop(creditors)
+        debt, debtor = heapq.heappop(debtors)
+        cents = min(-credit, -debt)
+        transfers.append((debtor, creditor, cents))
+        if -credit > cents:
+            heapq.heappush(creditors, (credit + cents, creditor))
+        if -debt > cents:
+            heapq.heappush(debtors, (debt + cents, debtor))
+    return transfers
+
+
+# Function to get the transfers settling every unpaid bill, of one group or of everyone
+def settlement(cur, group=None):
+    return [{"from": debtor, "to": creditor, "amount": cents / 100}
+            for debtor, creditor, cents in settle(net_balances(fetch_debts(cur, group)))]
+
+
+# Print the transfers settling the unpaid bills of a group or of everyone
+if __name__ == '__main__':
+    conn = psycopg2.connect(connection)
+    transfers = settlement(conn.cursor(), sys.argv[1] if len(sys.argv) > 1 else None)
+    conn.rollback()
+    conn.close()
+    for transfer in transfers:
+        print(f"{transfer['from']} pays {transfer['to']} {transfer['amount']:.2f}")
+    print(f"{len(transfers)} transfers")
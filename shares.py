@@ -0,0 +1,53 @@
+# Function to round like the builtin round(value, 2), only once per distinct value
+def round_shares(values):
+    import numpy as np
+
+    unique, inverse = np.unique(values, return_inverse=True)
+    rounded = np.fromiter((round(value, 2) for value in unique.tolist()), dtype=float, count=len(unique))
+    return rounded[inverse.reshape(-1)]
+
+
+# Function to resolve user shares of many items in one pass
+# Rows with a share of 0 split whatever the specified shares of their item leave over; the result lines up with
+# the input rows and matches the per-item normalisation of manage_bill, rounding included
+def resolve_shares(item_keys, shares):
+    # numpy is imported on first use so workers that never resolve shares start without it
+    import numpy as np
+
+    index = {}
+    codes = np.fromiter((index.setdefault(key, len(index)) for key in item_keys), dtype=np.intp)
+    shares = np.asarray(shares, dtype=float).reshape(-1)
+    if len(codes) == 0:
+        return []
+
+    specified = shares != 0
+    n_items = len(index)
+    n_specified = np.bincount(codes, weights=specified, minlength=n_items)[codes]
+    n_sharing = np.bincount(codes, weights=~specified, minlength=n_items)[codes]
+    total = np.bincount(codes, weights=np.where(specified, shares, 0.0), minlength=n_items)[codes]
+
+    resolved = shares.copy()
+    to_round = np.zeros(len(shares), dtype=bool)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Only specified users: spread the difference to 1 evenly across them
+        only_specified = (n_sharing == 0) & (total != 1)
+        resolved[only_specified] = shares[only_specified] + ((1 - total) / n_specified)[only_specified]
+        to_round |= only_specified
+
+        # Sharing users split the remainder evenly
+        remainder = (n_sharing != 0) & (total < 1) & ~specified
+        resolved[remainder] = ((1 - total) / n_sharing)[remainder]
+        to_round |= remainder
+
+        # Specified shares already cover the item: scale everyone down to equal parts
+        covered = (n_sharing != 0) & (total >= 1)
+        change = 1 / (n_specified + n_sharing)
+        over = covered & specified
+        adjusted = np.where(total > 1, shares + (1 - total) / n_specified, shares)
+        resolved[over] = (adjusted * change * n_specified)[over]
+        resolved[covered & ~specified] = change[covered & ~specified]
+        to_round |= covered
+
+    if to_round.any():
+        resolved[to_round] = round_shares(resolved[to_round])
+    return resolved.tolist()
@@ -0,0 +1,74 @@
+import os
+import uuid
+import queue
+from flask import current_app, stream_with_context
+
+STREAM_ITERSIZE = int(os.getenv("STREAM_ITERSIZE", "2000"))
+STREAM_CHUNK = 1 << 16
+SSE_KEEPALIVE = float(os.getenv("SSE_KEEPALIVE", "15"))
+# Event streams a worker serves at once, each holds a thread or greenlet of its own for as long as it is open
+SSE_MAX_CLIENTS = int(os.getenv("SSE_MAX_CLIENTS", "10"))
+
+
+# Function to iterate over a query through a server-side cursor, holding at most one fetch batch in memory
+def iter_query(conn, query, params=None):
+    cur = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+    cur.itersize = STREAM_ITERSIZE
+    cur.execute(query, params)
+    try:
+        yield from cur
+    finally:
+        cur.close()
+
+
+# Function to encode {key: [items...]} piece by piece, emitting chunks of roughly STREAM_CHUNK characters
+def iter_json(key, items):
+    dumps = current_app.json.dumps
+    chunk = [f"{{{dumps(key)}: ["]
+    size = 0
+    for index, item in enumerate(items):
+        encoded = dumps(item)
+        chunk.append(encoded if index == 0 else "," + encoded)
+        size += len(encoded) + 1
+        if size >= STREAM_CHUNK:
+            yield "".join(chunk)
+            chunk = []
+            size = 0
+    chunk.append("]}")
+    yield "".join(chunk)
+
+
+# Function to build a streamed JSON response, keeping the request (and its connection) alive until it is sent
+def stream_response(key, items):
+    return current_app.response_class(stream_with_context(iter_json(key, items)),
+                                      mimetype=current_app.json.mimetype)
+
+
+# Function to tell whether the client asked for a streamed response
+def wants_stream(args):
+    return args.get("stream", "0") in ("1", "true")
+
+
+# Function to build a server-sent events response from a feed subscription, sending a comment line while idle so
+# proxies keep the connection open; the stream ends when the feed drops the subscriber
+# Raises FeedFull when the feed already serves its maximum number of streams
+def event_response(feed, event):
+    events = feed.subscribe()
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    payload = events.get(timeout=SSE_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if payload is None:
+                    return
+                yield f"event: {event}\ndata: {payload}\n\n"
+        finally:
+            feed.unsubscribe(events)
+
+    return current_app.response_class(stream(), mimetype="text/event-stream",
+                                      headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,120 @@
+import os
+import json
+import pytest
+import psycopg2
+import server
+import ledger
+import cache_bus
+import settlement
+import bill_import
+from db import connection
+from pagination import limit_clause
+from bill_snapshot import SNAPSHOT_QUERY
+from bill_status import LOCK_BILLS_QUERY, BILL_STATUSES_QUERY, REFRESH_STATUS_QUERY
+
+# Tables smaller than this may be scanned in full
+MIN_ROWS = int(os.getenv("PLAN_MIN_ROWS", "10000"))
+
+if os.getenv("DB_USER") is None:
+    pytest.skip("no database configured", allow_module_level=True)
+
+
+# Function to build the first page of a listing query with the given filters, as its route does
+def listing(query, conditions, filters):
+    return f"{server.filtered_query(query, conditions, filters)}{limit_clause(50)};"
+
+
+# Queries issued by each route and job, with the tables they are allowed to read in full
+# They are the modules' own query constants, so the checked SQL follows every change to the code running it
+QUERIES = {
+    "/api/login": [(server.LOGIN_QUERY, ())],
+    "/api/user": [(server.USER_QUERY, ())],
+    "/api/bills": [(server.BILLS_QUERY, ("bills",))],
+    "/api/bill": [(SNAPSHOT_QUERY, ())],
+    "/api/user-bills": [(listing(server.USER_BILLS_QUERY, server.USER_BILLS_FILTERS, ["username"]), ()),
+                        (listing(server.USER_BILLS_QUERY, server.USER_BILLS_FILTERS, ["username", "after"]), ())],
+    "/api/user-bill": [(server.USER_BILL_QUERY, ())],
+    "/api/update-user-bill": [(server.BILL_USER_ITEMS_QUERY, ())],
+    "/api/remove-user-bills": [(server.REMOVE_USER_BILLS_QUERY, ()), (server.REMOVE_USER_ITEMS_QUERY, ())],
+    "/api/lock-user-bill": [(LOCK_BILLS_QUERY, ()), (BILL_STATUSES_QUERY, ()), (REFRESH_STATUS_QUERY, ())],
+    "/api/all-bills": [(listing(server.ALL_BILLS_QUERY, server.ALL_BILLS_FILTERS, []), ()),
+                       (listing(server.ALL_BILLS_QUERY, server.ALL_BILLS_FILTERS, ["status"]), ()),
+                       (listing(server.ALL_BILLS_QUERY, server.ALL_BILLS_FILTERS, ["group", "after"]), ())],
+    "/api/manage-bill": [(SNAPSHOT_QUERY, ())],
+    "/api/submit-bill": [(server.BILL_AMOUNTS_QUERY, ()), (server.SUBMIT_AMOUNTS_QUERY, ())],
+    "/api/users": [(server.USERS_QUERY, ())],
+    "/api/bill-split": [(server.BILL_SPLIT_QUERY, ())],
+    "/api/all-users": [(listing(server.ALL_USERS_QUERY, server.ALL_USERS_FILTERS, []), ()),
+                       (listing(server.ALL_USERS_QUERY, server.ALL_USERS_FILTERS, ["group"]), ())],
+    "settlement": [(settlement.DEBTS_QUERY, ()), (settlement.GROUP_DEBTS_QUERY, ())],
+    "ledger": [(ledger.LOCK_LEDGER_QUERY, ()), (ledger.REFRESH_LEDGER_QUERY, ())],
+    "cache bus": [(cache_bus.PUBLISH_QUERY, ())],
+    "bill import": [(bill_import.EXISTING_BILLS_QUERY, ()), (bill_import.EXISTING_USERS_QUERY, ())]
+}
+
+
+# Function to collect (node type, relation) for every node of a JSON plan
+def plan_nodes(plan):
+    yield plan["Node Type"], plan.get("Relation Name")
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+@pytest.fixture(scope="module")
+def cur():
+    try:
+        conn = psycopg2.connect(connection)
+    except psycopg2.OperationalError as error:
+        pytest.skip(f"database unavailable: {error}")
+    yield conn.cursor()
+    conn.rollback()
+    conn.close()
+
+
+@pytest.fixture(scope="module")
+def table_rows(cur):
+    cur.execute("select relname, reltuples from pg_class where relkind='r';")
+    return dict(cur.fetchall())
+
+
+# A real user, bill and group, so the planner sees typical selectivity
+@pytest.fixture(scope="module")
+def params(cur):
+    cur.execute("select ub.username, ub.bill_name, b.bill_group, b.status from user_bills ub\n"
+                "inner join bills b on b.bill_name=ub.bill_name limit 1;")
+    row = cur.fetchone()
+    if row is None:
+        cur.execute("select u.username, b.bill_name, b.bill_group, b.status from users u, bills b limit 1;")
+        row = cur.fetchone()
+    if row is None:
+        pytest.skip("database has no users or bills")
+    return {
+        "username": row[0],
+        "bill": row[1],
+        "group": row[2],
+        "status": row[3],
+        "usernames": [row[0]],
+        "bills": [row[1]],
+        "tags": ["bills"],
+        "amounts": [0],
+        "paid": False,
+        "after": row[1],
+        "rank": 3,
+        "name": ""
+    }
+
+
+@pytest.mark.parametrize("source, query, full_reads",
+                         [(source, query, full_reads) for source, queries in QUERIES.items()
+                          for query, full_reads in queries])
+def test_no_large_seq_scan(cur, table_rows, params, source, query, full_reads):
+    cur.execute("savepoint plan")
+    try:
+        cur.execute("explain (format json) " + query, params)
+        plan = cur.fetchone()[0]
+    finally:
+        cur.execute("rollback to savepoint plan")
+    plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+    scans = [relation for node, relation in plan_nodes(plan) if node == "Seq Scan"
+             and relation not in full_reads and table_rows.get(relation, 0) >= MIN_ROWS]
+    assert scans == [], f"{source} scans {', '.join(scans)} sequentially: {query.splitlines()[0]}"
@@ -0,0 +1,57 @@
+import random
+import pytest
+from shares import resolve_shares
+from benchmarks.shares import SHARE_CHOICES, reference_shares
+
+SEEDS = range(200)
+
+
+# Function to generate share rows for a random bill, with some items held by a single user
+def random_rows(rng):
+    rows = []
+    users = rng.randint(1, 12)
+    for item in range(rng.randint(1, 30)):
+        for user in rng.sample(range(users), rng.randint(1, users)):
+            rows.append((item, f"user{user}", rng.choice(SHARE_CHOICES)))
+    return rows
+
+
+def resolve(rows):
+    return resolve_shares([item for item, _, _ in rows], [share for _, _, share in rows])
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_matches_reference(seed):
+    rows = random_rows(random.Random(seed))
+    assert resolve(rows) == reference_shares(rows)
+
+
+# Each rounded share is at most half a cent off, so an item's shares add up to 1 within that per user
+@pytest.mark.parametrize("seed", SEEDS)
+def test_item_shares_sum_to_one(seed):
+    rows = random_rows(random.Random(seed))
+    totals = {}
+    counts = {}
+    for (item, _, _), share in zip(rows, resolve(rows)):
+        totals[item] = totals.get(item, 0) + share
+        counts[item] = counts.get(item, 0) + 1
+    for item, total in totals.items():
+        assert abs(total - 1) <= 0.005 * counts[item] + 1e-9
+
+
+@pytest.mark.parametrize("shares, expected", [
+    ([0], [1.0]),
+    ([0, 0, 0], [0.33, 0.33, 0.33]),
+    ([0.5, 0.5], [0.5, 0.5]),
+    ([0.2, 0.2], [0.5, 0.5]),
+    ([0.6, 0, 0], [0.6, 0.2, 0.2]),
+    ([0.75, 0.5, 0], [0.42, 0.25, 0.33])
+])
+def test_single_item(shares, expected):
+    rows = [("item", f"user{user}", share) for user, share in enumerate(shares)]
+    assert resolve(rows) == expected
+    assert reference_shares(rows) == expected
+
+
+def test_no_rows():
+    assert resolve_shares([], []) == []